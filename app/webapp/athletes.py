@@ -0,0 +1,169 @@
+import sys
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import repeat
+from typing import NamedTuple
+
+from search import fold_words
+
+
+class Athlete(NamedTuple):
+    """Competitor of one event's starting list."""
+
+    event_id: str
+    name: str
+    category: str
+    academy: str
+    branch: str
+
+
+class IndexedEvent:
+    """One event's competitors in the order of their folded names, with the
+    positions of the competitors having each name word.
+
+    The positions of all words are kept in one array, sorted by word and
+    then by name, so the competitors with a word starting with a prefix are
+    one slice of it. The starting list indexed is kept, so while it does not
+    change upstream it is neither parsed nor indexed again.
+    """
+
+    __slots__ = (
+        "name",
+        "participant_index",
+        "rows",
+        "clubs",
+        "folded",
+        "words",
+        "starts",
+        "positions",
+    )
+
+    def __init__(self, name, participant_index):
+        self.name = name
+        self.participant_index = participant_index
+        competitors = [
+            (row, club) for club, rows in participant_index.by_club.items() for row in rows
+        ]
+        folded_parts = {}  # First names and surnames repeat, fold each once
+        folded = []
+        for row, _ in competitors:
+            words = []
+            for part in row.name.split():
+                part_words = folded_parts.get(part)
+                if part_words is None:
+                    part_words = folded_parts[part] = fold_words(part)
+                words.extend(part_words)
+            folded.append(" ".join(words))
+        order = sorted(range(len(competitors)), key=folded.__getitem__)
+        self.rows = [competitors[position][0] for position in order]
+        self.clubs = [competitors[position][1] for position in order]
+        self.folded = [folded[position] for position in order]
+        positions_by_word = {}
+        for position, name in enumerate(self.folded):
+            for word in set(name.split()):
+                positions_by_word.setdefault(word, []).append(position)
+        self.words = sorted(map(sys.intern, positions_by_word))
+        self.starts = array("I", [0])
+        self.positions = array("I")
+        for word in self.words:
+            self.positions.extend(positions_by_word[word])
+            self.starts.append(len(self.positions))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _word_range(self, prefix):
+        """Positions in ``words`` of the ones starting with ``prefix``."""
+        first = bisect_left(self.words, prefix)
+        return first, bisect_left(self.words, prefix + "\uffff", first)
+
+    def matching(self, prefixes):
+        """Positions of the competitors with a word starting with each prefix,
+        in name order; a competitor with several such words may repeat."""
+        ranges = []
+        for prefix in prefixes:
+            first, last = self._word_range(prefix)
+            ranges.append((self.starts[last] - self.starts[first], first, last))
+        ranges.sort()  # Intersect starting from the fewest competitors
+        size, first, last = ranges[0]
+        if not size:
+            return ()
+        positions = self.positions[self.starts[first] : self.starts[last]]
+        if len(ranges) == 1:
+            return positions if last - first == 1 else sorted(positions)
+        positions = set(positions)
+        for _, first, last in ranges[1:]:
+            positions.intersection_update(self.positions[self.starts[first] : self.starts[last]])
+            if not positions:
+                return ()
+        return sorted(positions)
+
+    def athlete(self, event_id, position):
+        academy, branch = self.clubs[position]
+        row = self.rows[position]
+        return Athlete(event_id, row.name, row.category, academy, branch)
+
+
+class AthleteIndex:
+    """Competitors of several events searchable by the words of their names.
+
+    Each event is indexed on its own, so a changed starting list replaces
+    that event's index only.
+    """
+
+    def __init__(self):
+        self.version = 0  # Incremented on every change, for ETags
+        self.events = {}  # IndexedEvent by event id
+
+    def __len__(self):
+        return sum(map(len, self.events.values()))
+
+    def update(self, event_id, event_name, participant_index):
+        """Index an event's starting list, unless this very one is indexed.
+
+        Returns whether the event was indexed again.
+        """
+        indexed = self.events.get(event_id)
+        if indexed is not None and indexed.participant_index is participant_index:
+            indexed.name = event_name
+            return False
+        self.events[sys.intern(event_id)] = IndexedEvent(event_name, participant_index)
+        self.version += 1
+        return True
+
+    def remove(self, event_id):
+        if self.events.pop(event_id, None) is not None:
+            self.version += 1
+
+    def retain(self, event_ids):
+        """Remove the events not in ``event_ids``."""
+        for event_id in [event_id for event_id in self.events if event_id not in event_ids]:
+            self.remove(event_id)
+
+    def search(self, query, limit):
+        """Return up to ``limit`` athletes with a name word starting with each
+        query word, by name, so one competitor's entries in several events are
+        next to each other.
+
+        Diacritics are ignored.
+        """
+        prefixes = set(fold_words(query))
+        if not prefixes:
+            return []
+        lists = []
+        for event_id, indexed in self.events.items():
+            positions = indexed.matching(prefixes)
+            if positions:
+                lists.append(
+                    zip(map(indexed.folded.__getitem__, positions), repeat(event_id), positions)
+                )
+        athletes = []
+        previous = None
+        for _, event_id, position in merge(*lists):
+            if (event_id, position) != previous:
+                previous = (event_id, position)
+                athletes.append(self.events[event_id].athlete(event_id, position))
+                if len(athletes) == limit:
+                    break
+        return athletes
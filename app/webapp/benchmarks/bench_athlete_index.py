@@ -0,0 +1,109 @@
+"""Benchmark the cross-event athlete index on 50 events of 2000 competitors.
+
+Reports the time to index every event from scratch, to index one changed
+starting list again, the memory the index holds on top of the starting
+lists, the memory of the starting lists it keeps, and search latency. Names are drawn from a few hundred first names
+and a few thousand surnames with a Zipf-like skew, so the most common ones
+are about 5% and 1% of the competitors, as in Poland.
+
+Run from app/webapp: python -m benchmarks.bench_athlete_index
+"""
+
+import gc
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from athletes import AthleteIndex
+from cache import cache_entry_size
+from martialmatch_scraper import _parse_starting_list
+
+from benchmarks.synthetic import FIRST_NAMES, LAST_NAMES, starting_list_json
+
+EVENTS = 50
+COMPETITORS = 2000
+CATEGORIES = 200
+ROUNDS = 7
+SEARCH_ROUNDS = 1000
+QUERIES = ["nowak", "kow", "pio", "anna kow", "łukasz wiś", "nobody"]
+SYLLABLES = "ba bro cha dą ga je ka ko kra la le ły ma mi no pa pio ra ro sie ta wa wo".split()
+SUFFIXES = ["ski", "ska", "czyk", "iak", "ewicz", "ek", "ała"]
+
+
+def name_pools(rng):
+    """Return the first names and surnames, most common first."""
+    first_names = FIRST_NAMES + [
+        rng.choice(SYLLABLES).title() + rng.choice(SYLLABLES) + rng.choice("aen")
+        for _ in range(300)
+    ]
+    last_names = LAST_NAMES + [
+        (rng.choice(SYLLABLES) + rng.choice(SYLLABLES)).title() + rng.choice(SUFFIXES)
+        for _ in range(6000)
+    ]
+    return first_names, last_names
+
+
+def starting_list(event_id, pools):
+    """Return a starting list body with the competitors named from ``pools``."""
+    rng = random.Random(event_id)
+    payload = starting_list_json(COMPETITORS, CATEGORIES, seed=event_id)
+    first_names, last_names = pools
+    first_weights = [rank**-0.8 for rank in range(1, len(first_names) + 1)]
+    last_weights = [rank**-0.6 for rank in range(1, len(last_names) + 1)]
+    for category in payload["categories"]:
+        for competitor in category["competitors"]:
+            competitor["firstName"] = rng.choices(first_names, first_weights)[0]
+            competitor["lastName"] = rng.choices(last_names, last_weights)[0]
+    return _parse_starting_list(json.dumps(payload).encode())
+
+
+def build(starting_lists):
+    index = AthleteIndex()
+    for event_id, starting_list in starting_lists.items():
+        index.update(event_id, f"Event {event_id}", starting_list)
+    return index
+
+
+def median_ms(func, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    pools = name_pools(random.Random(0))
+    starting_lists = {
+        str(event_id): starting_list(event_id, pools) for event_id in range(EVENTS)
+    }
+    print(f"{EVENTS} events x {COMPETITORS} competitors")
+    print(f"{'full rebuild':<28}{median_ms(lambda: build(starting_lists), ROUNDS):10.1f} ms")
+
+    index = build(starting_lists)
+    changed = [starting_list(seed, pools) for seed in (EVENTS, EVENTS + 1)]
+    updates = iter(changed * ROUNDS)
+    update_ms = median_ms(lambda: index.update("0", "Event 0", next(updates)), ROUNDS)
+    print(f"{'one changed event':<28}{update_ms:10.1f} ms")
+
+    gc.collect()
+    tracemalloc.start()
+    index = build(starting_lists)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{'memory on top of the lists':<28}{size / 2**20:10.1f} MiB, {len(index)} athletes")
+    lists_size = sum(map(cache_entry_size, starting_lists.values()))
+    print(f"{'starting lists kept':<28}{lists_size / 2**20:10.1f} MiB")
+
+    for query in QUERIES:
+        hits = len(index.search(query, 20))
+        search_ms = median_ms(lambda: index.search(query, 20), SEARCH_ROUNDS)
+        print(f"{'search ' + repr(query):<28}{search_ms * 1000:10.1f} µs, {hits} hits")
+
+
+if __name__ == "__main__":
+    main()
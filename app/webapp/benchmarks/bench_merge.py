@@ -0,0 +1,66 @@
+"""Compare per-request latency of the merge with the prebuilt EventSchedule.
+
+Run from app/webapp: python -m benchmarks.bench_merge
+"""
+
+import json
+import logging
+import statistics
+import time
+
+from martialmatch_scraper import (EventSchedule, ParticipantIndex,
+                                  _parse_schedule,
+                                  merge_participants_with_schedule)
+
+from benchmarks.synthetic import schedule_json, starting_list_json
+
+COMPETITORS = 5000
+CATEGORIES = 400
+ROUNDS = 5
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure(request_path, clubs):
+    samples = []
+    for _ in range(ROUNDS):
+        for academy, branch in clubs:
+            start = time.perf_counter()
+            json.dumps(request_path(academy, branch))
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    logging.disable(logging.INFO)
+    index = ParticipantIndex(starting_list_json(COMPETITORS, CATEGORIES))
+    schedule = _parse_schedule(json.dumps(schedule_json(CATEGORIES)))
+    clubs = list(index.by_club)
+
+    def merge_path(academy, branch):
+        return merge_participants_with_schedule(
+            index.participants(academy, branch), schedule
+        )
+
+    start = time.perf_counter()
+    event_schedule = EventSchedule(index, schedule)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{COMPETITORS} competitors, {CATEGORIES} categories, {len(clubs)} clubs")
+    print(f"EventSchedule build (once per data version): {build_ms:.1f} ms")
+    for label, request_path in [
+        ("merge per request", merge_path),
+        ("prebuilt EventSchedule", event_schedule.for_club),
+    ]:
+        samples = measure(request_path, clubs)
+        print(
+            f"{label:<26} p50={statistics.median(samples):.3f} ms "
+            f"p99={percentile(samples, 99):.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Load-test /api/participants against a local stand-in upstream.
+
+Compares the previous handler, which returned a dict for FastAPI to encode
+on every request, with the pre-serialized and compressed bodies. Everything
+runs in one process, so the numbers are requests/s on one core.
+
+Run from app/webapp: python -m benchmarks.bench_participants_endpoint
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+import utils
+from fastapi import Query
+from main import app
+from martialmatch_scraper import (ParticipantIndex, get_event_freshness,
+                                  get_participants_schedule)
+
+from benchmarks.synthetic import schedule_json, starting_list_json
+
+COMPETITORS = 5000
+CATEGORIES = 400
+REQUESTS = 3000
+CONCURRENCY = 20
+
+
+@app.get("/bench/participants-dict")
+async def participants_dict(
+    event_id: str = Query(...), academy: str = Query(...), branch: str = Query("")
+):
+    schedule_per_day = await get_participants_schedule(event_id, academy, branch)
+    freshness = get_event_freshness(event_id)
+    return {
+        "schedule": schedule_per_day,
+        "is_stale": freshness.is_stale,
+        "fetched_at": freshness.fetched_at,
+    }
+
+
+def stand_in_upstream():
+    starting_list = json.dumps(starting_list_json(COMPETITORS, CATEGORIES)).encode()
+    schedule = json.dumps(schedule_json(CATEGORIES)).encode()
+
+    def handler(request):
+        body = starting_list if "starting-lists" in request.url.path else schedule
+        return httpx.Response(200, content=body)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def load(client, path, clubs, headers):
+    queue = asyncio.Queue()
+    for i in range(REQUESTS):
+        queue.put_nowait(clubs[i % len(clubs)])
+    sent = []
+
+    async def worker():
+        while not queue.empty():
+            academy, branch = queue.get_nowait()
+            params = {"event_id": "1", "academy": academy, "branch": branch}
+            async with client.stream("GET", path, params=params, headers=headers) as r:
+                # Count bytes on the wire; decoding would add client work to the timing
+                sent.append(sum([len(chunk) async for chunk in r.aiter_raw()]))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    return REQUESTS / (time.perf_counter() - start), sum(sent) / len(sent)
+
+
+async def main():
+    logging.disable(logging.INFO)
+    utils._http_client = stand_in_upstream()
+    index = ParticipantIndex(starting_list_json(COMPETITORS, CATEGORIES))
+    # The busiest clubs, whose responses are the largest
+    clubs = sorted(index.by_club, key=lambda club: -len(index.by_club[club]))[:20]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await load(client, "/api/participants", clubs, {})  # warm the caches
+        print(f"{COMPETITORS} competitors, {len(clubs)} clubs, {REQUESTS} requests")
+        for label, path, encoding in [
+            ("dict through FastAPI", "/bench/participants-dict", "identity"),
+            ("pre-serialized identity", "/api/participants", "identity"),
+            ("pre-serialized gzip", "/api/participants", "gzip"),
+            ("pre-serialized br", "/api/participants", "br"),
+        ]:
+            rate, size = await load(client, path, clubs, {"Accept-Encoding": encoding})
+            print(f"{label:<26} {rate:8.0f} req/s  {size:8.0f} bytes/response")
+    await utils.close_http_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
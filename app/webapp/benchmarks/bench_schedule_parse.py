@@ -0,0 +1,87 @@
+"""Micro-benchmark of schedule time conversion on 10k schedule rows.
+
+Run from app/webapp: python -m benchmarks.bench_schedule_parse
+"""
+
+import json
+import logging
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from martialmatch_scraper import DATE_FORMAT, TIMEZONE, _parse_schedule, _to_local_time
+
+from benchmarks.synthetic import schedule_json
+
+ROWS = 10000
+ROUNDS = 7
+
+
+def strptime_conversion(value):
+    """Per-row conversion used before the fast path."""
+    local_time = (
+        datetime.strptime(value, DATE_FORMAT)
+        .replace(tzinfo=pytz.UTC)
+        .astimezone(TIMEZONE)
+    )
+    return int(local_time.timestamp()), local_time.strftime("%H:%M")
+
+
+def timed(func):
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    logging.disable(logging.INFO)
+    payload = schedule_json(categories=ROWS, days=3, mats=20)
+    times = [
+        (
+            category["scheduledCategoryTime"]["start"],
+            category["scheduledCategoryTime"]["end"],
+        )
+        for day in payload["schedules"]
+        for mat in day["mats"]
+        for category in mat["categories"]
+    ]
+
+    first = datetime.strptime(times[0][0], DATE_FORMAT)
+    distinct_times = [
+        (first + timedelta(seconds=2 * i)).strftime(DATE_FORMAT)
+        for i in range(2 * ROWS)
+    ]
+
+    def convert_all(conversion):
+        for start, end in times:
+            conversion(start)
+            conversion(end)
+
+    def cold_fast_path_distinct():
+        _to_local_time.cache_clear()
+        for value in distinct_times:
+            _to_local_time(value)
+
+    def cold_fast_path():
+        _to_local_time.cache_clear()
+        convert_all(_to_local_time)
+
+    content = json.dumps(payload).encode()
+    cases = [
+        ("strptime + pytz per row", lambda: convert_all(strptime_conversion)),
+        ("fast path, cold memo", cold_fast_path),
+        ("fast path, distinct times", cold_fast_path_distinct),
+        ("fast path, warm memo", lambda: convert_all(_to_local_time)),
+        ("_parse_schedule, warm memo", lambda: _parse_schedule(content)),
+    ]
+    print(f"{len(times)} schedule rows, median of {ROUNDS} runs")
+    for label, func in cases:
+        print(f"{label:<28} {timed(func):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark ingestion of a 10k-competitor starting list.
+
+Compares the lean index, parsed with orjson and keeping only names, clubs and
+categories, with the previous one that kept the whole json.loads tree. Memory
+is what the index still holds once the response body is gone.
+
+Run from app/webapp: python -m benchmarks.bench_starting_list
+"""
+
+import gc
+import json
+import statistics
+import time
+import tracemalloc
+
+from martialmatch_scraper import Participant, _parse_starting_list
+
+from benchmarks.synthetic import starting_list_json
+
+COMPETITORS = 10000
+CATEGORIES = 400
+ROUNDS = 7
+
+
+class TreeParticipantIndex:
+    """Index used before lean ingestion, holding on to the parsed JSON."""
+
+    __slots__ = ("json_data", "by_club", "by_academy")
+
+    def __init__(self, json_data):
+        self.json_data = json_data
+        self.by_club = {}
+        self.by_academy = {}
+        for cat in json_data.get("categories", []):
+            category_name = cat.get("category", "")
+            for comp in cat.get("competitors", []):
+                academy = comp.get("academy") or ""
+                branch = (comp.get("branch") or "").strip()
+                name = f"{comp.get('firstName', '')} {comp.get('lastName', '')}"
+                row = Participant(name, category_name)
+                self.by_academy.setdefault(academy, []).append(row)
+                self.by_club.setdefault((academy, branch), []).append(row)
+
+
+def tree_parse(content):
+    return TreeParticipantIndex(json.loads(content))
+
+
+def timed(parse, content):
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        parse(content)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def retained(parse, content):
+    gc.collect()
+    tracemalloc.start()
+    index = parse(content)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del index
+    return size
+
+
+def main():
+    content = json.dumps(starting_list_json(COMPETITORS, CATEGORIES)).encode()
+    print(f"{len(content) / 2**20:.1f} MiB starting list, {COMPETITORS} competitors")
+    for label, parse in [
+        ("json tree kept", tree_parse),
+        ("lean orjson index", _parse_starting_list),
+    ]:
+        parse_ms = timed(parse, content)
+        size = retained(parse, content)
+        print(f"{label:<20} {parse_ms:8.1f} ms  {size / 2**20:8.2f} MiB retained")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark parsing of a multi-megabyte events list page.
+
+Compares the anchor-only HTMLParser extraction with the BeautifulSoup parse
+it replaced, when bs4 is installed, and checks both give the same list.
+
+Run from app/webapp: python -m benchmarks.bench_tournament_parse
+"""
+
+import re
+import statistics
+import time
+
+from martialmatch_scraper import _parse_tournament_page
+
+from benchmarks.synthetic import events_page_html
+
+EVENTS = 8000
+ROUNDS = 5
+
+
+def beautifulsoup_parse(content):
+    """Extraction used before the anchor-only parser."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, "html.parser")
+    tournament_ids = []
+    seen_ids = set()
+    for link in soup.find_all("a", href=re.compile(r"^/pl/events/\d+.*")):
+        href = link.get("href")
+        id_match = re.search(r"/pl/events/(\d+.*?)(?:/|$)", href)
+        if id_match and id_match.group(1) not in seen_ids:
+            name = link.text.strip()
+            if name:
+                tournament_id = id_match.group(1)
+                seen_ids.add(tournament_id)
+                tournament_ids.append({"id": tournament_id, "name": name})
+    return tournament_ids
+
+
+def timed(func, content):
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = func(content)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    content = events_page_html(EVENTS, pages=12)
+    print(f"{len(content) / 2**20:.1f} MiB page, {EVENTS} events, median of {ROUNDS} runs")
+    parse_ms, page = timed(_parse_tournament_page, content)
+    print(f"{'anchor-only HTMLParser':<24} {parse_ms:8.1f} ms")
+    try:
+        soup_ms, expected = timed(beautifulsoup_parse, content)
+    except ImportError:
+        print("bs4 is not installed, skipping the BeautifulSoup baseline")
+        return
+    print(f"{'BeautifulSoup':<24} {soup_ms:8.1f} ms")
+    print(f"identical output: {page.tournaments == expected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Stand-in for martialmatch.com serving generated events, lists and schedules.
+
+Every event serves the same generated starting list and schedule; payload
+sizes and the latency of each response are configurable. Requests are
+counted per endpoint, so benchmarks can tell how many reached upstream.
+
+In process, pass ``FakeUpstream().app`` to httpx.ASGITransport. As a server
+for a locally running app started with MARTIALMATCH_BASE_URL=http://127.0.0.1:8001:
+
+Run from app/webapp: python -m benchmarks.fake_upstream --port 8001
+"""
+
+import argparse
+import asyncio
+import json
+from collections import Counter
+
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from benchmarks.synthetic import events_page_html, schedule_json, starting_list_json
+
+
+class FakeUpstream:
+    def __init__(
+        self,
+        competitors=5000,
+        categories=400,
+        events_per_page=300,
+        archive_pages=5,
+        latency=0.0,
+    ):
+        self.latency = latency
+        self.requests = Counter()
+        self.events_per_page = events_per_page
+        self.archive_pages = archive_pages
+        self._pages = {}  # Generated events list pages by first event id
+        self.starting_list = json.dumps(starting_list_json(competitors, categories)).encode()
+        self.schedule = json.dumps(schedule_json(categories)).encode()
+        self.app = Starlette(
+            routes=[
+                Route("/pl/events", self.active_events),
+                Route("/pl/events/archive", self.archived_events),
+                Route("/api/events/{event_id}/starting-lists/public", self.starting_lists),
+                Route("/api/events/{event_id}/schedules", self.schedules),
+            ]
+        )
+
+    async def _respond(self, endpoint, body, media_type):
+        self.requests[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return Response(body, media_type=media_type)
+
+    def _events_page(self, first_id):
+        page = self._pages.get(first_id)
+        if page is None:
+            page = self._pages[first_id] = events_page_html(
+                self.events_per_page, first_id, self.archive_pages
+            )
+        return page
+
+    async def active_events(self, request):
+        return await self._respond("events", self._events_page(1), "text/html")
+
+    async def archived_events(self, request):
+        page_number = int(request.query_params.get("page", "1"))
+        first_id = self.events_per_page * page_number + 1
+        return await self._respond("archive", self._events_page(first_id), "text/html")
+
+    async def starting_lists(self, request):
+        return await self._respond("starting-lists", self.starting_list, "application/json")
+
+    async def schedules(self, request):
+        return await self._respond("schedules", self.schedule, "application/json")
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--competitors", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per response")
+    args = parser.parse_args()
+    upstream = FakeUpstream(args.competitors, args.categories, latency=args.latency)
+    uvicorn.run(upstream.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Benchmark suite: micro-benchmarks and load scenarios, saved as JSON.
+
+Micro-benchmarks time the scraper's hot paths on synthetic data. Load
+scenarios run the FastAPI app in process against benchmarks.fake_upstream,
+reporting throughput, p50/p95/p99 latency and the requests that reached
+upstream, including stampedes on expired and on stale cache entries.
+
+Results go to benchmarks/results/<UTC time>.json; pass --compare with an
+earlier results file to print the change of every metric.
+
+Run from app/webapp: python -m benchmarks.harness [--quick] [--compare FILE]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+
+import httpx
+import martialmatch_scraper
+import response_bodies
+import utils
+from main import app
+from martialmatch_scraper import (EventSchedule, _parse_schedule,
+                                  _parse_starting_list, _parse_tournament_page,
+                                  merge_participants_with_schedule)
+
+from benchmarks.fake_upstream import FakeUpstream
+from benchmarks.synthetic import events_page_html
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+FULL = {"competitors": 5000, "categories": 400, "rounds": 7, "requests": 3000}
+QUICK = {"competitors": 1000, "categories": 100, "rounds": 3, "requests": 300}
+CONCURRENCY = 20
+STAMPEDE_REQUESTS = 200  # Simultaneous requests hitting one expired event
+UPSTREAM_LATENCY = 0.05  # Seconds the fake upstream takes per response
+
+
+def summarize(samples_ms):
+    """Median and tail of latency samples in milliseconds."""
+    if len(samples_ms) < 2:
+        samples_ms = samples_ms * 2
+    centiles = statistics.quantiles(samples_ms, n=100, method="inclusive")
+    return {
+        "p50_ms": round(statistics.median(samples_ms), 3),
+        "p95_ms": round(centiles[94], 3),
+        "p99_ms": round(centiles[98], 3),
+    }
+
+
+def timed(func, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def micro_benchmarks(upstream, config):
+    """Time parsing, indexing, merging and lookups on the fake upstream's data."""
+    rounds = config["rounds"]
+    index = _parse_starting_list(upstream.starting_list)
+    schedule = _parse_schedule(upstream.schedule)
+    clubs = list(index.by_club)
+    event_schedule = EventSchedule(index, schedule)
+    events_page = events_page_html(config["competitors"] // 2, pages=10)
+    return {
+        "schedule_parse": timed(lambda: _parse_schedule(upstream.schedule), rounds),
+        "starting_list_parse": timed(
+            lambda: _parse_starting_list(upstream.starting_list), rounds
+        ),
+        "participants_lookup_all_clubs": timed(
+            lambda: [index.participants(*club) for club in clubs], rounds
+        ),
+        "merge_participants_with_schedule_all_clubs": timed(
+            lambda: [
+                merge_participants_with_schedule(index.participants(*club), schedule)
+                for club in clubs
+            ],
+            rounds,
+        ),
+        "event_schedule_build": timed(lambda: EventSchedule(index, schedule), rounds),
+        "event_schedule_lookup_all_clubs": timed(
+            lambda: [event_schedule.for_club(*club) for club in clubs], rounds
+        ),
+        "tournament_page_parse": timed(lambda: _parse_tournament_page(events_page), rounds),
+    }
+
+
+def clear_caches():
+    martialmatch_scraper.participants_cache.clear()
+    martialmatch_scraper.schedule_cache.clear()
+    martialmatch_scraper.event_schedule_cache.clear()
+    martialmatch_scraper.close_tournament_catalog()
+    utils._upstream_records.clear()
+    response_bodies._encoded_bodies.clear()
+
+
+def age_caches(seconds):
+    """Make every cached entry and upstream record look ``seconds`` older."""
+    for cache in (martialmatch_scraper.participants_cache, martialmatch_scraper.schedule_cache):
+        for entry in cache.values():
+            entry.fetched_at -= seconds
+    for record in utils._upstream_records.values():
+        record.fetched_at -= seconds
+
+
+async def load(client, upstream, requests, concurrency):
+    """Send (path, params) requests from ``concurrency`` workers."""
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    samples = []
+    errors = 0
+    upstream_before = sum(upstream.requests.values())
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            path, params = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.get(path, params=params, headers={"Accept-Encoding": "br"})
+            samples.append((time.perf_counter() - start) * 1000)
+            errors += response.status_code != 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(requests),
+        "requests_per_s": round(len(requests) / elapsed, 1),
+        **summarize(samples),
+        "errors": errors,
+        "upstream_requests": sum(upstream.requests.values()) - upstream_before,
+    }
+
+
+async def load_scenarios(upstream, config):
+    utils._http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=upstream.app))
+    index = _parse_starting_list(upstream.starting_list)
+    clubs = sorted(index.by_club, key=lambda club: -len(index.by_club[club]))[:20]
+    count = config["requests"]
+
+    def participants(event_ids, number):
+        requests = []
+        for i in range(number):
+            academy, branch = clubs[i % len(clubs)]
+            params = {"event_id": event_ids[i % len(event_ids)], "academy": academy}
+            requests.append(("/api/participants", {**params, "branch": branch}))
+        return requests
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        clear_caches()
+        await load(client, upstream, participants(["1"], len(clubs)), CONCURRENCY)
+        results["participants_warm"] = await load(
+            client, upstream, participants(["1"], count), CONCURRENCY
+        )
+
+        clear_caches()
+        results["participants_cold_events"] = await load(
+            client, upstream, participants([str(i) for i in range(1, 21)], count), CONCURRENCY
+        )
+
+        clear_caches()
+        stampede = participants(["1"], STAMPEDE_REQUESTS)
+        results["stampede_expired"] = await load(
+            client, upstream, stampede, STAMPEDE_REQUESTS
+        )
+
+        age_caches(martialmatch_scraper.PARTICIPANTS_CACHE_TTL)
+        results["stampede_stale"] = await load(client, upstream, stampede, STAMPEDE_REQUESTS)
+        await asyncio.sleep(UPSTREAM_LATENCY * 4)  # Let the background refreshes finish
+
+        clear_caches()
+        tournaments = [("/api/tournaments", {"limit": 50, "q": ""})] * count
+        results["tournaments"] = await load(client, upstream, tournaments, CONCURRENCY)
+    await utils.close_http_client()
+    return results
+
+
+def compare(baseline, current):
+    """Print every metric of two results files side by side."""
+    for section in ("micro", "load"):
+        for name, metrics in current[section].items():
+            base_metrics = baseline.get(section, {}).get(name, {})
+            for metric, value in metrics.items():
+                base = base_metrics.get(metric)
+                change = f"{(value - base) / base * 100:+7.1f}%" if base else ""
+                print(f"{section:<6}{name:<44}{metric:<18}{base!s:>10} {value:>10} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="Smaller data and fewer runs")
+    parser.add_argument("--output", help="Results file, by default in benchmarks/results")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    config = QUICK if args.quick else FULL
+    upstream = FakeUpstream(
+        config["competitors"], config["categories"], latency=UPSTREAM_LATENCY
+    )
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {**config, "concurrency": CONCURRENCY, "upstream_latency": UPSTREAM_LATENCY},
+        "micro": micro_benchmarks(upstream, config),
+        "load": asyncio.run(load_scenarios(upstream, config)),
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Saved to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
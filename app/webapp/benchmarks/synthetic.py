@@ -0,0 +1,94 @@
+"""Synthetic martialmatch.com payloads for benchmarks."""
+
+import random
+from datetime import datetime, timedelta
+
+FIRST_NAMES = ["Anna", "Jan", "Piotr", "Ewa", "Marek", "Zofia", "Łukasz", "Ola"]
+LAST_NAMES = ["Nowak", "Kowalski", "Wiśniewska", "Wójcik", "Zieliński", "Mazur"]
+BRANCHES = ["Warszawa", "Kraków", "Ruda Śląska", "Bielsko Biała", "Gdańsk", ""]
+
+
+def starting_list_json(competitors=5000, categories=400, clubs=150, seed=1):
+    """Return a starting-lists payload with competitors spread over categories."""
+    rng = random.Random(seed)
+    academies = [f"Academy {i}" for i in range(clubs)]
+    payload = {"categories": []}
+    for c in range(categories):
+        payload["categories"].append({"category": f"category {c}", "competitors": []})
+    for i in range(competitors):
+        payload["categories"][i % categories]["competitors"].append(
+            {
+                "id": i,
+                "firstName": rng.choice(FIRST_NAMES),
+                "lastName": f"{rng.choice(LAST_NAMES)} {i}",
+                "academy": rng.choice(academies),
+                "branch": rng.choice(BRANCHES),
+                "country": "PL",
+                "belt": "white",
+                "weight": None,
+            }
+        )
+    return payload
+
+
+def schedule_json(categories=400, days=2, mats=8, start="2024-03-30 07:00:00"):
+    """Return a schedules payload placing each category on one mat slot."""
+    first_start = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
+    per_day = -(-categories // days)
+    schedules = []
+    for d in range(days):
+        mats_payload = [
+            {"name": f"Mata {m + 1}", "categories": []} for m in range(mats)
+        ]
+        for position, c in enumerate(
+            range(d * per_day, min(categories, (d + 1) * per_day))
+        ):
+            slot_start = first_start + timedelta(
+                days=d, minutes=20 * (position // mats)
+            )
+            mats_payload[position % mats]["categories"].append(
+                {
+                    "name": f"category {c}",
+                    "scheduledCategoryTime": {
+                        "start": slot_start.strftime("%Y-%m-%d %H:%M:%S"),
+                        "end": (slot_start + timedelta(minutes=20)).strftime(
+                            "%Y-%m-%d %H:%M:%S"
+                        ),
+                    },
+                }
+            )
+        schedules.append({"name": f"Dzień {d + 1}", "mats": mats_payload})
+    return {"schedules": schedules}
+
+
+def events_page_html(events=3000, first_id=1, pages=1, seed=1):
+    """Return an events list page laid out like martialmatch.com's.
+
+    Each event card links to the event twice, once around its poster and once
+    around its name, between navigation, inline scripts and SVG icons.
+    """
+    rng = random.Random(seed)
+    parts = [
+        "<!DOCTYPE html><html><head><title>Wydarzenia</title>",
+        "<style>.card{display:flex}</style>",
+        "<script>window.__STATE__ = {events: '<a href=\"/pl/events/0\">x</a>'};</script>",
+        "</head><body><nav>",
+        '<a href="/pl/events">Wydarzenia</a><a href="/pl/events/archive">Archiwum</a>',
+        "</nav><main>",
+    ]
+    for i in range(first_id, first_id + events):
+        slug = f"{i}-{rng.choice(LAST_NAMES).lower()}-open-{2000 + i % 25}"
+        parts.append(
+            f'<div class="card"><a href="/pl/events/{slug}">'
+            f'<img src="/images/{i}.jpg" alt=""></a>'
+            f'<div class="card-body"><h3><a href="/pl/events/{slug}/starting-lists">'
+            f"  Puchar {rng.choice(LAST_NAMES)} &amp; {rng.choice(BRANCHES) or 'Polska'}"
+            f" {2000 + i % 25} </a></h3>"
+            '<svg viewBox="0 0 24 24"><path d="M12 2L2 7l10 5 10-5-10-5z"/></svg>'
+            f"<!-- event {i} --><p>{rng.choice(BRANCHES)}</p></div></div>"
+        )
+    parts.append('</main><div class="pagination">')
+    for page in range(1, pages + 1):
+        parts.append(f'<a href="/pl/events/archive?page={page}">{page}</a>')
+    parts.append("</div></body></html>")
+    return "".join(parts).encode()
@@ -0,0 +1,496 @@
+import asyncio
+import contextvars
+import inspect
+import logging
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from functools import wraps
+
+import redis.asyncio as redis
+from cachetools import TLRUCache, TTLCache
+from metrics import CACHE_REQUESTS, instrument_cache
+
+logger = logging.getLogger(__name__)
+
+_fetched_at = contextvars.ContextVar("fetched_at", default=None)
+_version = contextvars.ContextVar("version", default=None)
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+EXTEND_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single execution.
+
+    The first caller runs the function, every caller arriving while it is in
+    flight waits for and receives the same result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+    def in_flight(self, key):
+        """Return whether a call for ``key`` is currently running."""
+        with self._lock:
+            return key in self._calls or key in self._tasks
+
+    def do(self, key, func):
+        """Run ``func`` for ``key`` once among concurrent threads."""
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._calls[key] = Future()
+        if not is_leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key, func):
+        """Await ``func()`` for ``key`` once among concurrent coroutines.
+
+        The shared task is shielded, so a cancelled waiter (e.g. a client
+        that disconnected) does not cancel the fetch for everyone else.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None or task.get_loop() is not loop:
+                task = self._tasks[key] = loop.create_task(func())
+                task.add_done_callback(lambda t: self._forget_task(key, t))
+        return await asyncio.shield(task)
+
+    def _forget_task(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+
+class ChangeFeed:
+    """Latest value of a source, with a version its subscribers wait on.
+
+    Publishing wakes every waiting subscriber at once, however many there are.
+    """
+
+    def __init__(self, value=None):
+        self.value = value
+        self.version = 0
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+
+    def publish(self, value):
+        self.value = value
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, version, timeout):
+        """Wait for a version newer than ``version``; return False on timeout."""
+        if self.version != version:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class CacheEntry:
+    """Cached value together with the wall-clock time it was fetched at and,
+    if reported, the version of the data it was built from."""
+
+    __slots__ = ("value", "fetched_at", "version")
+
+    def __init__(self, value, fetched_at=None, version=None):
+        self.value = value
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.version = version
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def is_stale(self, ttl):
+        return ttl is not None and self.age() >= ttl
+
+
+def deep_getsizeof(value):
+    """Approximate the bytes held by ``value`` and everything it references.
+
+    Objects reachable several times, like interned strings, are counted once.
+    """
+    seen = set()
+    stack = [value]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, (str, bytes, int, float, type(None))):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            for cls in type(obj).__mro__:
+                for slot in cls.__dict__.get("__slots__", ()):
+                    stack.append(getattr(obj, slot, None))
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+    return size
+
+
+def cache_entry_size(value):
+    """Size of a cached value, or of a CacheEntry's value, in bytes.
+
+    Values with a ``cache_size()`` method report their own size, e.g. to
+    leave out objects already held by another cache.
+    """
+    if isinstance(value, CacheEntry):
+        value = value.value
+    cache_size = getattr(value, "cache_size", None)
+    return cache_size() if cache_size is not None else deep_getsizeof(value)
+
+
+class MeasuredOnce:
+    """Mixin for parse results that report their deep size to byte-budgeted
+    caches, measured the first time it is asked for.
+
+    Unchanged refreshes store the same object again; it is not walked again.
+    Subclasses declare a ``_cache_size`` slot.
+    """
+
+    __slots__ = ()
+
+    def cache_size(self):
+        size = getattr(self, "_cache_size", None)
+        if size is None:
+            size = self._cache_size = deep_getsizeof(self)
+        return size
+
+
+class _ByteBudget:
+    """Bounds a cachetools cache by the measured size of its values in bytes.
+
+    Each value is measured once when it is stored; least recently used
+    entries are evicted until the new one fits. A value larger than the whole
+    budget is not cached.
+    """
+
+    def __init__(self, max_bytes, *args, **kwargs):
+        super().__init__(max_bytes, *args, getsizeof=cache_entry_size, **kwargs)
+        self.max_bytes = max_bytes
+
+    def __setitem__(self, key, value):
+        try:
+            super().__setitem__(key, value)
+        except ValueError:
+            self.pop(key, None)
+            logger.warning(f"Not caching {key}: larger than the {self.max_bytes} byte budget")
+
+
+class SizedTTLCache(_ByteBudget, TTLCache):
+    """TTLCache holding at most ``max_bytes`` of values."""
+
+
+class SizedTLRUCache(_ByteBudget, TLRUCache):
+    """TLRUCache holding at most ``max_bytes`` of values."""
+
+
+def report_fetched_at(timestamp):
+    """Report when the data being loaded by a cached call was really fetched.
+
+    Data taken from a shared cache may be older than the call loading it; the
+    cache entry is then stamped with the original fetch time.
+    """
+    _fetched_at.set(timestamp)
+
+
+def report_version(version):
+    """Report the version of the data being loaded by a cached call, e.g. a
+    digest of the upstream body, which stays the same across refreshes that
+    return unchanged data."""
+    _version.set(version)
+
+
+_background_tasks = set()
+
+
+def _spawn(coro):
+    """Run ``coro`` in the background, keeping a reference until it is done."""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def cache_with_ttl(cache, ttl=None):
+    """Time-based cache decorator counting hits, stale hits and misses.
+
+    Concurrent misses for the same key are coalesced, so only one call to the
+    wrapped function is in flight per key and all waiters share its outcome.
+
+    When ``ttl`` is given it is the soft expiry: older entries are still served
+    (stale-while-revalidate) while a background refresh runs, until ``cache``
+    itself evicts them at its own, longer TTL. The wrapper exposes
+    ``cache_entry(*args)`` to inspect an entry and ``refresh(*args)`` to reload
+    one ahead of expiry.
+    """
+
+    def decorator(func):
+        flight = SingleFlight()
+        instrument_cache(func.__name__, cache)
+        hits = CACHE_REQUESTS.labels(func.__name__, "hit")
+        stale_hits = CACHE_REQUESTS.labels(func.__name__, "stale")
+        misses = CACHE_REQUESTS.labels(func.__name__, "miss")
+
+        def make_key(args, kwargs):
+            return str(args) + str(kwargs)
+
+        def cache_entry(*args, **kwargs):
+            return cache.get(make_key(args, kwargs))
+
+        if inspect.iscoroutinefunction(func):
+
+            async def load(key, args, kwargs):
+                _fetched_at.set(None)
+                _version.set(None)
+                result = await func(*args, **kwargs)
+                if result is not None:
+                    cache[key] = CacheEntry(result, _fetched_at.get(), _version.get())
+                return result
+
+            async def revalidate(key, args, kwargs):
+                try:
+                    await flight.do_async(key, lambda: load(key, args, kwargs))
+                except Exception as e:
+                    logger.warning(
+                        f"[CACHE REFRESH FAILED] {func.__name__} key={key}: {e}"
+                    )
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = make_key(args, kwargs)
+                entry = cache.get(key)
+                if entry is not None:
+                    if entry.is_stale(ttl):
+                        stale_hits.inc()
+                        if not flight.in_flight(key):
+                            _spawn(revalidate(key, args, kwargs))
+                    else:
+                        hits.inc()
+                    return entry.value
+                misses.inc()
+                return await flight.do_async(key, lambda: load(key, args, kwargs))
+
+            async def refresh(*args, **kwargs):
+                key = make_key(args, kwargs)
+                return await flight.do_async(key, lambda: load(key, args, kwargs))
+
+            async_wrapper.cache_entry = cache_entry
+            async_wrapper.refresh = refresh
+            async_wrapper.ttl = ttl
+            return async_wrapper
+
+        def load(key, args, kwargs):
+            _fetched_at.set(None)
+            _version.set(None)
+            result = func(*args, **kwargs)
+            if result is not None:
+                cache[key] = CacheEntry(result, _fetched_at.get(), _version.get())
+            return result
+
+        def revalidate(key, args, kwargs):
+            try:
+                flight.do(key, lambda: load(key, args, kwargs))
+            except Exception as e:
+                logger.warning(f"[CACHE REFRESH FAILED] {func.__name__} key={key}: {e}")
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
+            entry = cache.get(key)
+            if entry is not None:
+                if entry.is_stale(ttl):
+                    stale_hits.inc()
+                    if not flight.in_flight(key):
+                        threading.Thread(
+                            target=revalidate, args=(key, args, kwargs), daemon=True
+                        ).start()
+                else:
+                    hits.inc()
+                return entry.value
+            misses.inc()
+
+            def load_once():
+                entry = cache.get(key)
+                if entry is not None:
+                    return entry.value
+                return load(key, args, kwargs)
+
+            return flight.do(key, load_once)
+
+        def refresh(*args, **kwargs):
+            key = make_key(args, kwargs)
+            return flight.do(key, lambda: load(key, args, kwargs))
+
+        wrapper.cache_entry = cache_entry
+        wrapper.refresh = refresh
+        wrapper.ttl = ttl
+        return wrapper
+
+    return decorator
+
+
+class SQLiteCache:
+    """Shared cache backend storing entries with expiry in an SQLite file.
+
+    Meant for a single node, where several workers share one file, and tests.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, timeout=5, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, value, now + ttl)
+            )
+
+    def _add(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "DELETE FROM entries WHERE key = ? AND expires_at <= ?", (key, now)
+                )
+                added = self._db.execute(
+                    "INSERT OR IGNORE INTO entries VALUES (?, ?, ?)",
+                    (key, value, now + ttl),
+                ).rowcount
+            finally:
+                self._db.execute("COMMIT")
+        return added == 1
+
+    def _delete(self, key, value):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM entries WHERE key = ? AND value = ?", (key, value)
+            )
+
+    def _extend(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE entries SET expires_at = ? "
+                "WHERE key = ? AND value = ? AND expires_at > ?",
+                (now + ttl, key, value, now),
+            )
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key, value, ttl):
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def acquire_lock(self, key, ttl):
+        """Return a token if the lock was acquired, None if someone holds it."""
+        token = secrets.token_hex(8).encode()
+        return token if await asyncio.to_thread(self._add, key, token, ttl) else None
+
+    async def release_lock(self, key, token):
+        await asyncio.to_thread(self._delete, key, token)
+
+    async def extend_lock(self, key, token, ttl):
+        """Keep a held lock for ``ttl`` more seconds."""
+        await asyncio.to_thread(self._extend, key, token, ttl)
+
+    async def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RedisCache:
+    """Shared cache backend for several replicas, speaking the Redis protocol."""
+
+    def __init__(self, url):
+        self._client = redis.from_url(url)
+
+    async def get(self, key):
+        return await self._client.get(key)
+
+    async def set(self, key, value, ttl):
+        await self._client.set(key, value, px=int(ttl * 1000))
+
+    async def acquire_lock(self, key, ttl):
+        """Return a token if the lock was acquired, None if someone holds it."""
+        token = secrets.token_hex(8).encode()
+        acquired = await self._client.set(key, token, nx=True, px=int(ttl * 1000))
+        return token if acquired else None
+
+    async def release_lock(self, key, token):
+        await self._client.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+
+    async def extend_lock(self, key, token, ttl):
+        """Keep a held lock for ``ttl`` more seconds."""
+        await self._client.eval(EXTEND_LOCK_SCRIPT, 1, key, token, int(ttl * 1000))
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def create_shared_cache(url):
+    """Create a shared cache backend from a redis:// or sqlite:/// URL."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteCache(url[len("sqlite:///") :])
+    raise ValueError(f"Unsupported shared cache URL: {url}")
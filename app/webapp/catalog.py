@@ -0,0 +1,138 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from search import PrefixIndex
+
+STATUSES = ("active", "archived")
+
+
+class TournamentCatalog:
+    """Tournaments seen on the events lists, kept in SQLite between restarts.
+
+    Archived tournaments never change, so a refresh only merges the current
+    active list and the newly archived tournaments at the top of the archive.
+    The lists served by /api/tournaments and the search index are rebuilt
+    once per merge.
+    """
+
+    def __init__(self, path=":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tournaments (id TEXT PRIMARY KEY, "
+            "name TEXT NOT NULL, status TEXT NOT NULL, rank INTEGER NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)"
+        )
+        self._load()
+
+    def _load(self):
+        lists = {status: [] for status in STATUSES}
+        for tournament_id, name, status in self._db.execute(
+            "SELECT id, name, status FROM tournaments ORDER BY rank"
+        ):
+            lists[status].append({"id": tournament_id, "name": name})
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = 'refreshed_at'"
+        ).fetchone()
+        self.lists = lists
+        self.refreshed_at = row[0] if row else None
+        self.version = hashlib.blake2b(
+            json.dumps(lists).encode(), digest_size=12
+        ).hexdigest()
+        self._statuses = {
+            tournament["id"]: status
+            for status, tournaments in lists.items()
+            for tournament in tournaments
+        }
+        self._index = PrefixIndex(
+            ((status, position), tournament["name"])
+            for status, tournaments in lists.items()
+            for position, tournament in enumerate(tournaments)
+        )
+
+    def is_archived(self, tournament_id):
+        return self._statuses.get(tournament_id) == "archived"
+
+    def age(self):
+        return time.time() - self.refreshed_at if self.refreshed_at else None
+
+    def merge(self, active, archived):
+        """Record the current active list and tournaments from the archive top.
+
+        ``archived`` is newest first; tournaments not archived before are
+        placed ahead of the known ones, known ones only get their name updated.
+        Tournaments that left the active list are archived as well.
+        """
+        archived_ids = {tournament["id"] for tournament in archived}
+        active_ids = {tournament["id"] for tournament in active}
+        left_active = [
+            tournament
+            for tournament in self.lists["active"]
+            if tournament["id"] not in active_ids and tournament["id"] not in archived_ids
+        ]
+        newly_archived = [
+            tournament
+            for tournament in left_active + archived
+            if not self.is_archived(tournament["id"]) and tournament["id"] not in active_ids
+        ]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                top_rank = self._db.execute(
+                    "SELECT COALESCE(MIN(rank), 0) FROM tournaments WHERE status = 'archived'"
+                ).fetchone()[0]
+                for position, tournament in enumerate(newly_archived):
+                    self._upsert(
+                        tournament,
+                        "archived",
+                        top_rank - len(newly_archived) + position,
+                    )
+                for tournament in archived:
+                    if tournament["id"] not in active_ids:
+                        self._db.execute(
+                            "UPDATE tournaments SET name = ? WHERE id = ?",
+                            (tournament["name"], tournament["id"]),
+                        )
+                for position, tournament in enumerate(active):
+                    self._upsert(tournament, "active", position)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('refreshed_at', ?)", (time.time(),)
+                )
+            finally:
+                self._db.execute("COMMIT")
+            self._load()
+
+    def _upsert(self, tournament, status, rank):
+        self._db.execute(
+            "INSERT OR REPLACE INTO tournaments VALUES (?, ?, ?, ?)",
+            (tournament["id"], tournament["name"], status, rank),
+        )
+
+    def search(self, query="", limit=None):
+        """Return tournaments per status whose name has words starting with
+        every word of ``query``, in list order, at most ``limit`` per status.
+
+        Diacritics are ignored, so "slaska" finds "Śląska".
+        """
+        matches = self._index.matches(query)
+        if matches is None:
+            return {
+                status: tournaments[:limit] for status, tournaments in self.lists.items()
+            }
+        return {
+            status: [
+                self.lists[status][position]
+                for match_status, position in sorted(matches)
+                if match_status == status
+            ][:limit]
+            for status in STATUSES
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
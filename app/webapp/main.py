@@ -1,57 +1,157 @@
+import asyncio
+import hashlib
 import logging
-from contextlib import asynccontextmanager
+import time
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Body, FastAPI, HTTPException, Query, Response
 from fastapi.requests import Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from martialmatch_scraper import (ALLOWED_CLUBS, EventNotFoundError,
+from martialmatch_scraper import (ALLOWED_CLUBS, ATHLETE_SEARCH_LIMIT,
+                                  PARTICIPANTS_CACHE_TTL,
+                                  SCHEDULE_CACHE_TTL, TIMELINE_LIMIT,
+                                  TOURNAMENTS_CACHE_TTL,
+                                  EventNotFoundError,
                                   ParticipantsNotFoundError,
                                   ScheduleNotFoundError,
-                                  fetch_all_tournament_ids,
+                                  close_tournament_catalog,
                                   fetch_event_clubs,
-                                  get_participants_schedule)
+                                  fetch_tournament_catalog, find_athletes,
+                                  get_athletes_freshness,
+                                  get_event_clubs_freshness,
+                                  get_event_freshness,
+                                  get_event_timeline,
+                                  get_participants_schedule,
+                                  get_participants_schedules,
+                                  get_tournaments_freshness,
+                                  open_tournament_catalog,
+                                  run_refresh_scheduler,
+                                  search_event_clubs,
+                                  stream_participants_schedule)
+from metrics import RESPONSE_SIZE
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel, Field
 from pydantic import ValidationError as PydanticValidationError
 from pydantic import field_validator
+from response_bodies import (choose_encoding, encoded_body,
+                             encoded_json_response, format_sse_event)
+from utils import (close_http_client, close_shared_cache, load_snapshot,
+                   open_http_client, open_shared_cache, run_snapshot_writer,
+                   save_snapshot)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    scraper_log = logging.getLogger("martialmatch_scraper")
     uvicorn_log = logging.getLogger("uvicorn")
-    scraper_log.handlers = list(uvicorn_log.handlers)
-    scraper_log.setLevel(logging.INFO)
-    scraper_log.propagate = False
+    for name in ("martialmatch_scraper", "cache", "utils"):
+        scraper_log = logging.getLogger(name)
+        scraper_log.handlers = list(uvicorn_log.handlers)
+        scraper_log.setLevel(logging.INFO)
+        scraper_log.propagate = False
+    restored = load_snapshot()
+    if restored:
+        uvicorn_log.info(f"Restored {restored} cached upstream responses from snapshot")
+    open_tournament_catalog()
+    await open_http_client()
+    await open_shared_cache()
+    background_tasks = [
+        asyncio.create_task(run_refresh_scheduler()),
+        asyncio.create_task(run_snapshot_writer()),
+    ]
     yield
+    for task in background_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await save_snapshot()
+    await close_shared_cache()
+    await close_http_client()
+    close_tournament_catalog()
 
 
 app = FastAPI(lifespan=lifespan)
 
+SSE_RETRY_MS = 10000  # Delay before browsers reconnect a dropped schedule stream
+BATCH_MAX_CLUBS = 30  # Maximum number of clubs in one batch request
+CLUB_SEARCH_LIMIT = 10  # Clubs returned by the typeahead search by default
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 templates = Jinja2Templates(directory="templates")
 
 
+def version_key(*parts):
+    """Hash the cache version and request parameters a response depends on."""
+    return hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=12).hexdigest()
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match", "")
+    client_etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in client_etags or "*" in client_etags
+
+
+def cached_json_response(request, key_parts, freshness, ttl, build):
+    """Serve the JSON body ``build()`` returns, serialized once per data version.
+
+    The strong ETag covers the data version and the content coding, and a
+    client holding the current copy gets an empty 304 without any body work.
+    Clients may keep a copy for the rest of the server's soft TTL and serve it
+    while revalidating for one more TTL, like the scraper caches do.
+    """
+    key = version_key(*key_parts)
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    etag = f'"{key}-{encoding}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={freshness.max_age}, stale-while-revalidate={ttl}",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response = encoded_json_response(encoded_body(key, build), encoding, headers)
+    RESPONSE_SIZE.labels(key_parts[0], encoding).observe(len(response.body))
+    return response
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Expose Prometheus metrics: upstream requests, timings, caches and response sizes."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
 @app.get("/api/tournaments")
-async def get_tournaments():
-    tournaments = fetch_all_tournament_ids()
-    if not tournaments:
+async def get_tournaments(
+    request: Request,
+    q: str = Query("", max_length=100, description="Words the tournament names start with"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Tournaments per list"),
+):
+    try:
+        catalog = await fetch_tournament_catalog()
+    except Exception:
         raise HTTPException(status_code=500, detail="Failed to fetch tournament IDs")
-    return {"tournaments": tournaments}
+    freshness = get_tournaments_freshness()
+    return cached_json_response(
+        request,
+        ("tournaments", freshness.version, q, limit),
+        freshness,
+        TOURNAMENTS_CACHE_TTL,
+        lambda: {"tournaments": catalog.search(q, limit)},
+    )
 
 
 @app.get("/api/clubs")
@@ -72,17 +172,73 @@ async def get_clubs():
 
 @app.get("/api/event-clubs")
 async def get_event_clubs(
+    request: Request,
     event_id: str = Query(..., min_length=1, max_length=100, description="Tournament event ID"),
 ):
     try:
-        clubs = fetch_event_clubs(event_id.strip())
-        return {"clubs": clubs}
+        event_id = event_id.strip()
+        clubs = await fetch_event_clubs(event_id)
+        freshness = get_event_clubs_freshness(event_id)
+        return cached_json_response(
+            request,
+            ("event-clubs", event_id, freshness.version),
+            freshness,
+            PARTICIPANTS_CACHE_TTL,
+            lambda: {"clubs": clubs},
+        )
     except EventNotFoundError as e:
         return {"clubs": [], "message": str(e)}
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@app.get("/api/event-clubs/search")
+async def search_clubs(
+    request: Request,
+    event_id: str = Query(..., min_length=1, max_length=100, description="Tournament event ID"),
+    q: str = Query("", max_length=200, description="Words the club names start with"),
+    limit: int = Query(CLUB_SEARCH_LIMIT, ge=1, le=50, description="Maximum number of clubs"),
+):
+    """Return the event's clubs matching a typeahead query, with competitor counts."""
+    try:
+        event_id = event_id.strip()
+        clubs = await search_event_clubs(event_id, q, limit)
+        freshness = get_event_clubs_freshness(event_id)
+        return cached_json_response(
+            request,
+            ("event-clubs-search", event_id, freshness.version, q, limit),
+            freshness,
+            PARTICIPANTS_CACHE_TTL,
+            lambda: {"clubs": clubs},
+        )
+    except EventNotFoundError as e:
+        return {"clubs": [], "message": str(e)}
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.get("/api/athletes/search")
+async def search_athletes(
+    request: Request,
+    q: str = Query(..., min_length=3, max_length=200, description="Words the names start with"),
+    limit: int = Query(
+        ATHLETE_SEARCH_LIMIT, ge=1, le=100, description="Maximum number of athletes"
+    ),
+):
+    """Return athletes of the active tournaments matching a name query, each
+    with the schedule slots of their category."""
+    athletes = find_athletes(q, limit)
+    freshness = get_athletes_freshness()
+    return cached_json_response(
+        request,
+        # Slots are joined from the schedule cache, which the index does not version
+        ("athletes-search", freshness.version, q, limit, athletes),
+        freshness,
+        0,
+        lambda: {"athletes": athletes},
+    )
+
+
 @app.get("/api/server-time")
 async def get_server_time():
     """Return current server time."""
@@ -91,16 +247,36 @@ async def get_server_time():
 
 @app.get("/api/participants")
 async def get_participants(
+    request: Request,
     event_id: str = Query(..., description="Tournament event ID"),
     academy: str = Query(..., description="Club academy name"),
     branch: str = Query("", description="Club branch name"),
 ) -> Dict[str, Any]:
     try:
         params = ParticipantRequest(event_id=event_id, academy=academy, branch=branch)
-        schedule_per_day = get_participants_schedule(
+        schedule_per_day = await get_participants_schedule(
             params.event_id, params.academy, params.branch
         )
-        return {"schedule": schedule_per_day}
+        freshness = get_event_freshness(params.event_id)
+        key_parts = (
+            "participants",
+            params.event_id,
+            params.academy,
+            params.branch,
+            freshness.version,
+            freshness.is_stale,
+        )
+        return cached_json_response(
+            request,
+            key_parts,
+            freshness,
+            SCHEDULE_CACHE_TTL,
+            lambda: {
+                "schedule": schedule_per_day,
+                "is_stale": freshness.is_stale,
+                "fetched_at": freshness.fetched_at,
+            },
+        )
     except PydanticValidationError as e:
         error_msg = e.errors()[0]["msg"] if e.errors() else "Validation error"
         raise HTTPException(status_code=400, detail=error_msg)
@@ -112,6 +288,142 @@ async def get_participants(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@app.get("/api/timeline")
+async def get_timeline(
+    request: Request,
+    event_id: str = Query(..., min_length=1, max_length=100, description="Tournament event ID"),
+    academy: str = Query("", max_length=200, description="Club academy name"),
+    branch: str = Query("", max_length=200, description="Club branch name"),
+    mat: str = Query("", max_length=100, description="Mat name"),
+    at: Optional[int] = Query(None, description="Unix timestamp, now by default"),
+    limit: int = Query(TIMELINE_LIMIT, ge=1, le=20, description="Maximum upcoming slots"),
+):
+    """Return the slots running now and the next ones, for a club or a mat.
+
+    Meant for polling: the body and its ETag only change when a slot starts
+    or ends, and clients may keep it until then.
+    """
+    event_id, academy, branch, mat = (
+        value.strip() for value in (event_id, academy, branch, mat)
+    )
+    if not academy and not mat:
+        raise HTTPException(status_code=400, detail="Either academy or mat is required")
+    now = time.time() if at is None else at
+    try:
+        view = await get_event_timeline(event_id, now, academy, branch, mat, limit)
+        freshness = get_event_freshness(event_id)
+        if view.changes_at is not None:
+            max_age = min(freshness.max_age, max(0, int(view.changes_at - now)))
+            freshness = freshness._replace(max_age=max_age)
+        key_parts = (
+            "timeline",
+            event_id,
+            academy,
+            branch,
+            mat,
+            freshness.version,
+            freshness.is_stale,
+            view.running,
+            view.upcoming,
+        )
+        return cached_json_response(
+            request,
+            key_parts,
+            freshness,
+            0,
+            lambda: {
+                "now": view.running,
+                "next": view.upcoming,
+                "is_stale": freshness.is_stale,
+                "fetched_at": freshness.fetched_at,
+            },
+        )
+    except (EventNotFoundError, ScheduleNotFoundError, ParticipantsNotFoundError) as e:
+        return {"now": [], "next": [], "message": str(e)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=e.args[0] if e.args else str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.get("/api/participants/stream")
+async def stream_participants(
+    event_id: str = Query(..., description="Tournament event ID"),
+    academy: str = Query(..., description="Club academy name"),
+    branch: str = Query("", description="Club branch name"),
+):
+    """Stream a club's schedule as Server-Sent Events: the whole schedule
+    first, then only the rows that changed."""
+    try:
+        params = ParticipantRequest(event_id=event_id, academy=academy, branch=branch)
+    except PydanticValidationError as e:
+        error_msg = e.errors()[0]["msg"] if e.errors() else "Validation error"
+        raise HTTPException(status_code=400, detail=error_msg)
+
+    async def events():
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        try:
+            async for event, data in stream_participants_schedule(
+                params.event_id, params.academy, params.branch
+            ):
+                yield ": keep-alive\n\n" if event is None else format_sse_event(event, data)
+        except Exception as e:
+            # Closing the stream makes the browser reconnect after SSE_RETRY_MS
+            logging.getLogger("uvicorn").warning(f"Schedule stream failed: {e}")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/participants/batch")
+async def get_participants_batch(
+    clubs: List[Dict[str, Any]] = Body(
+        ...,
+        embed=True,
+        min_length=1,
+        max_length=BATCH_MAX_CLUBS,
+        description="Clubs as objects with event_id, academy and branch",
+    ),
+) -> Dict[str, Any]:
+    """Return the schedules of several clubs, keyed by "event_id|academy|branch".
+
+    Every entry succeeds or fails on its own, like a separate /api/participants call.
+    """
+    results = {}
+    valid_clubs = []
+    for club in clubs:
+        try:
+            params = ParticipantRequest(**club)
+        except PydanticValidationError as e:
+            key = "|".join(str(club.get(field, "")) for field in ParticipantRequest.model_fields)
+            error_msg = e.errors()[0]["msg"] if e.errors() else "Validation error"
+            results[key] = {"error": error_msg}
+            continue
+        valid_clubs.append((params.event_id, params.academy, params.branch))
+    schedules = await get_participants_schedules(valid_clubs)
+    for (event_id, academy, branch), schedule in schedules.items():
+        key = f"{event_id}|{academy}|{branch}"
+        if isinstance(
+            schedule, (EventNotFoundError, ScheduleNotFoundError, ParticipantsNotFoundError)
+        ):
+            results[key] = {"schedule": {}, "message": str(schedule)}
+        elif isinstance(schedule, ValueError):
+            results[key] = {"error": schedule.args[0] if schedule.args else str(schedule)}
+        elif isinstance(schedule, Exception):
+            results[key] = {"error": "Internal server error"}
+        else:
+            freshness = get_event_freshness(event_id)
+            results[key] = {
+                "schedule": schedule,
+                "is_stale": freshness.is_stale,
+                "fetched_at": freshness.fetched_at,
+            }
+    return {"results": results}
+
+
 # Models for validation
 class ParticipantRequest(BaseModel):
     event_id: str = Field(..., min_length=1, max_length=100, description="Tournament event ID")
@@ -1,14 +1,28 @@
+import asyncio
+import json
 import logging
+import os
 import re
+import sys
 import time
-from datetime import datetime
-from functools import wraps
+import weakref
+from datetime import datetime, timedelta
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import NamedTuple, Optional
 
-import pandas as pd
+import orjson
 import pytz
-from bs4 import BeautifulSoup
+from athletes import AthleteIndex
+from cache import (ChangeFeed, MeasuredOnce, SingleFlight, SizedTLRUCache,
+                   SizedTTLCache, cache_with_ttl, deep_getsizeof)
 from cachetools import TTLCache
-from utils import EventNotFoundHTTPError, extract_numeric_id, make_api_request
+from catalog import TournamentCatalog
+from metrics import MERGE_TIME, instrument_cache
+from search import PrefixIndex, fold
+from timeline import Timeline
+from utils import (CACHE_MEMORY_BUDGET, EventNotFoundHTTPError,
+                   extract_numeric_id, fetch_parsed)
 
 logger = logging.getLogger(__name__)
 
@@ -38,13 +52,48 @@ class EventNotFoundError(Exception):
         super().__init__(message)
 
 
-BASE_URL = "https://martialmatch.com"
+BASE_URL = os.environ.get(  # Upstream, e.g. benchmarks.fake_upstream for load tests
+    "MARTIALMATCH_BASE_URL", "https://martialmatch.com"
+)
 PARTICIPANTS_CACHE_TTL = 1800  # Cache time in seconds (30 minutes)
 SCHEDULE_CACHE_TTL = 600  # Cache time in seconds (10 minutes)
 TOURNAMENTS_CACHE_TTL = 3600  # Cache time in seconds (60 minutes)
-CACHE_SIZE = 50  # Maximum number of items in cache
+CACHE_MAX_STALENESS = 10800  # Stale entries are served for at most 3 hours
+CACHE_SIZE = 50  # Maximum number of watched events
+PARTICIPANTS_CACHE_BYTES = int(  # Indexed starting lists
+    os.environ.get("PARTICIPANTS_CACHE_BYTES", CACHE_MEMORY_BUDGET * 30 // 100)
+)
+SCHEDULE_CACHE_BYTES = int(  # Parsed schedules
+    os.environ.get("SCHEDULE_CACHE_BYTES", CACHE_MEMORY_BUDGET * 10 // 100)
+)
+EVENT_SCHEDULE_CACHE_BYTES = int(  # Schedules of every club joined up front
+    os.environ.get("EVENT_SCHEDULE_CACHE_BYTES", CACHE_MEMORY_BUDGET * 25 // 100)
+)
+TIMELINE_CACHE_BYTES = int(  # Schedule slots indexed by mat and category
+    os.environ.get("TIMELINE_CACHE_BYTES", CACHE_MEMORY_BUDGET * 5 // 100)
+)
+TIMELINE_LIMIT = 5  # Upcoming slots returned by the timeline by default
+ATHLETE_INDEX_EVENTS = int(  # Active tournaments whose athletes are searchable
+    os.environ.get("ATHLETE_INDEX_EVENTS", "50")
+)
+ATHLETE_SEARCH_LIMIT = 20  # Athletes returned by the cross-event search by default
+WATCHED_EVENT_TTL = 1800  # Events requested in the last 30 minutes are kept warm
+REFRESH_INTERVAL = 60  # Seconds between background refresh passes
+REFRESH_AHEAD = 120  # Refresh watched entries this many seconds before expiry
+STREAM_HEARTBEAT_INTERVAL = 15  # Seconds between keep-alives on idle schedule streams
 TIMEZONE = pytz.timezone("Europe/Warsaw")
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+UNIX_EPOCH = datetime(1970, 1, 1)
+TOURNAMENT_URLS = (f"{BASE_URL}/pl/events", f"{BASE_URL}/pl/events/archive")
+TOURNAMENT_MAX_PAGES = 20  # Maximum number of pages followed per tournament list
+TOURNAMENT_CATALOG_PATH = os.environ.get("TOURNAMENT_CATALOG_PATH", "")  # SQLite file
+EVENT_HREF_PATTERN = re.compile(r"^/pl/events/\d+")
+EVENT_ID_PATTERN = re.compile(r"/pl/events/(\d+.*?)(?:/|$)")
+PAGE_HREF_PATTERN = re.compile(r"^(/pl/events(?:/archive)?)\?(?:[^#]*&)?page=(\d+)")
+VOID_ELEMENTS = frozenset(  # Elements without end tags, never left open
+    "area base br col embed hr img input link meta param source track wbr".split()
+)
 API_COOKIES = {"PANEL_LANGUAGE_V3": "pl", "PANEL_TIMEZONE": "Europe/Warsaw"}
 
 ALLOWED_CLUBS = {
@@ -65,190 +114,913 @@ ALLOWED_CLUBS = {
     },
 }
 
-participants_cache = TTLCache(maxsize=CACHE_SIZE, ttl=PARTICIPANTS_CACHE_TTL)
-schedule_cache = TTLCache(maxsize=CACHE_SIZE, ttl=SCHEDULE_CACHE_TTL)
-tournaments_cache = TTLCache(maxsize=CACHE_SIZE, ttl=TOURNAMENTS_CACHE_TTL)
 
+def _staleness_limit(key, entry, now):
+    # From the upstream fetch, so entries stored again from the last response
+    # while upstream is down do not outlive CACHE_MAX_STALENESS
+    return entry.fetched_at + CACHE_MAX_STALENESS
 
-def cache_with_ttl(cache):
-    """Time-based cache decorator with logging for HIT/MISS."""
 
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            key = str(args) + str(kwargs)
-            result = cache.get(key)
-            if result is not None:
-                logger.info(f"[CACHE HIT] {func.__name__} key={key}")
-                return result
-            logger.info(f"[CACHE MISS] {func.__name__} key={key}")
-            result = func(*args, **kwargs)
-            cache[key] = result
-            return result
+participants_cache = SizedTLRUCache(
+    PARTICIPANTS_CACHE_BYTES, ttu=_staleness_limit, timer=time.time
+)
+schedule_cache = SizedTLRUCache(SCHEDULE_CACHE_BYTES, ttu=_staleness_limit, timer=time.time)
+event_schedule_cache = instrument_cache(
+    "event_schedule", SizedTTLCache(EVENT_SCHEDULE_CACHE_BYTES, ttl=CACHE_MAX_STALENESS)
+)
+event_feeds = {}  # Change feeds of events with schedule stream subscribers
+timeline_cache = instrument_cache(
+    "timeline", SizedTTLCache(TIMELINE_CACHE_BYTES, ttl=CACHE_MAX_STALENESS)
+)
+watched_events = TTLCache(maxsize=CACHE_SIZE, ttl=WATCHED_EVENT_TTL)
+athlete_index = AthleteIndex()  # Athletes of active tournaments, by name word
 
-        return wrapper
 
-    return decorator
+class Participant(NamedTuple):
+    """Competitor of a club together with the category they compete in."""
 
+    name: str
+    category: str
 
-@cache_with_ttl(participants_cache)
-def _fetch_participants_json(event_id):
-    """Fetch and cache the raw starting-lists JSON for an event."""
+
+class ScheduleSlot(NamedTuple):
+    """Scheduled time of a category on a mat, in Europe/Warsaw local time."""
+
+    category: str
+    mat: str
+    day: str
+    time: str
+    start_timestamp: int
+    end_timestamp: int
+
+
+class Schedule(MeasuredOnce, list):
+    """ScheduleSlot list of an event's schedule."""
+
+    __slots__ = ("_cache_size", "__weakref__")
+
+
+class ParticipantIndex(MeasuredOnce):
+    """Competitors of an event's starting list indexed by club.
+
+    Built once per fetched starting list, so club lookups and the club list
+    are dictionary reads instead of a scan over every competitor. Only names,
+    clubs and categories are kept, with the strings repeated across
+    competitors interned; the parsed JSON is dropped once indexed.
+    """
+
+    __slots__ = (
+        "by_club",
+        "by_academy",
+        "clubs",
+        "club_sizes",
+        "_club_index",
+        "_folded_names",
+        "_clubs_by_size",
+        "_cache_size",
+        "__weakref__",  # Referenced by upstream records
+    )
+
+    def __init__(self, json_data):
+        self.by_club = {}
+        self.by_academy = {}
+        # Row lists of each raw (academy, branch) pair, so the club strings
+        # are cleaned and interned once per club rather than per competitor
+        club_rows = {}
+        for cat in json_data.get("categories", []):
+            category_name = sys.intern(cat.get("category", ""))
+            for comp in cat.get("competitors", []):
+                raw_club = (comp.get("academy"), comp.get("branch"))
+                rows = club_rows.get(raw_club)
+                if rows is None:
+                    academy = sys.intern(raw_club[0] or "")
+                    branch = sys.intern((raw_club[1] or "").strip())
+                    rows = club_rows[raw_club] = (
+                        self.by_academy.setdefault(academy, []),
+                        self.by_club.setdefault((academy, branch), []),
+                    )
+                name = f"{comp.get('firstName', '')} {comp.get('lastName', '')}"
+                row = Participant(name, category_name)
+                rows[0].append(row)
+                rows[1].append(row)
+        self.clubs, self.club_sizes = self._build_clubs()
+        self._club_index = PrefixIndex(
+            (position, club["display_name"]) for position, club in enumerate(self.clubs)
+        )
+        self._folded_names = [fold(club["display_name"]) for club in self.clubs]
+        # Ranking of the empty query, which the page sends on every focus
+        self._clubs_by_size = sorted(
+            range(len(self.clubs)), key=lambda position: -self.club_sizes[position]
+        )
+
+    def _build_clubs(self):
+        clubs = {}
+        sizes = {}
+        for (academy, branch), rows in self.by_club.items():
+            academy = academy.strip()
+            if not academy:
+                continue
+            if (academy, branch) not in clubs:
+                display = f"{academy} ({branch})" if branch else academy
+                clubs[(academy, branch)] = {
+                    "academy": academy,
+                    "branch": branch,
+                    "display_name": display,
+                }
+            sizes[(academy, branch)] = sizes.get((academy, branch), 0) + len(rows)
+        keys = sorted(clubs, key=lambda key: clubs[key]["display_name"].lower())
+        return [clubs[key] for key in keys], [sizes[key] for key in keys]
+
+    def search_clubs(self, query, limit):
+        """Return up to ``limit`` clubs with a word starting with each query word.
+
+        Diacritics are ignored. Clubs whose name starts with the query come
+        first, then clubs with more competitors.
+        """
+        matches = self._club_index.matches(query)
+        folded_query = fold(query.strip())
+        if matches is None and not folded_query:
+            ranked = self._clubs_by_size
+        else:
+            ranked = sorted(
+                range(len(self.clubs)) if matches is None else matches,
+                key=lambda position: (
+                    not self._folded_names[position].startswith(folded_query),
+                    -self.club_sizes[position],
+                    position,
+                ),
+            )
+        return [
+            {**self.clubs[position], "competitors": self.club_sizes[position]}
+            for position in ranked[:limit]
+        ]
+
+    def participants(self, academy, branch=""):
+        """Return Participant rows of a club in starting-list order."""
+        if branch:
+            return self.by_club.get((academy, branch), [])
+        return self.by_academy.get(academy, [])
+
+
+@cache_with_ttl(participants_cache, ttl=PARTICIPANTS_CACHE_TTL)
+async def _fetch_participant_index(event_id):
+    """Fetch the starting-lists JSON for an event and cache its club index."""
+    return await _load_participant_index(event_id)
+
+
+async def _load_participant_index(event_id):
+    """Fetch an event's club index, reusing it while the starting list is
+    unchanged upstream."""
     numeric_id = extract_numeric_id(event_id)
     url = f"{BASE_URL}/api/events/{numeric_id}/starting-lists/public"
     try:
-        return make_api_request(url, API_COOKIES).json()
+        return await fetch_parsed(
+            url,
+            _parse_starting_list,
+            API_COOKIES,
+            max_age=PARTICIPANTS_CACHE_TTL - REFRESH_AHEAD,
+        )
     except EventNotFoundHTTPError:
         raise EventNotFoundError()
 
 
-def fetch_bjj_participants(event_id, academy, branch=""):
-    json_data = _fetch_participants_json(event_id)
-    start_time_prof = time.time()
-    participant_data = []
-    for cat in json_data.get("categories", []):
-        category_name = cat.get("category", "")
-        for comp in cat.get("competitors", []):
-            if comp.get("academy") == academy and (
-                not branch or comp.get("branch", "").strip() == branch
-            ):
-                name = f"{comp['firstName']} {comp['lastName']}"
-                participant_data.append((name, category_name))
-    df = pd.DataFrame(participant_data, columns=["name", "category"])
-    logger.info(
-        f"[PROFILE] fetch_bjj_participants data parsing took {time.time() - start_time_prof:.4f} seconds"
-    )
-    return df
+def _parse_starting_list(content):
+    return ParticipantIndex(orjson.loads(content))
 
 
-@cache_with_ttl(schedule_cache)
-def fetch_bjj_schedule(event_id):
+async def fetch_bjj_participants(event_id, academy, branch=""):
+    index = await _fetch_participant_index(event_id)
+    return index.participants(academy, branch)
+
+
+@cache_with_ttl(schedule_cache, ttl=SCHEDULE_CACHE_TTL)
+async def fetch_bjj_schedule(event_id):
     numeric_id = extract_numeric_id(event_id)
     url = f"{BASE_URL}/api/events/{numeric_id}/schedules"
-    json_data = make_api_request(url, API_COOKIES).json()
-    start_time_prof = time.time()
-    schedule_data = []
+    return await fetch_parsed(
+        url, _parse_schedule, API_COOKIES, max_age=SCHEDULE_CACHE_TTL - REFRESH_AHEAD
+    )
+
+
+def _parse_schedule(content):
+    """Build the list of ScheduleSlot from a schedules API response body."""
+    json_data = json.loads(content)
+    schedule_data = Schedule()
     for day in json_data.get("schedules", []):
         for mat in day.get("mats", []):
             for category in mat.get("categories", []):
                 try:
                     times = category.get("scheduledCategoryTime", {})
-                    start_time = datetime.strptime(times["start"], DATE_FORMAT)
-                    end_time = datetime.strptime(times["end"], DATE_FORMAT)
-                    start_time_tz = start_time.replace(tzinfo=pytz.UTC).astimezone(
-                        TIMEZONE
-                    )
-                    end_time_tz = end_time.replace(tzinfo=pytz.UTC).astimezone(TIMEZONE)
-                    start = start_time_tz.strftime("%H:%M")
-                    end = end_time_tz.strftime("%H:%M")
-                    start_timestamp = int(start_time_tz.timestamp())
-                    end_timestamp = int(end_time_tz.timestamp())
+                    start_timestamp, start = _to_local_time(times["start"])
+                    end_timestamp, end = _to_local_time(times["end"])
                     schedule_data.append(
-                        [
+                        ScheduleSlot(
                             category["name"],
                             mat["name"],
                             day["name"],
                             f"{start} - {end}",
                             start_timestamp,
                             end_timestamp,
-                        ]
+                        )
                     )
                 except (KeyError, ValueError):
                     continue
-    df = pd.DataFrame(
-        schedule_data,
-        columns=[
-            "category",
-            "mat",
-            "day",
-            "time",
-            "start_timestamp",
-            "end_timestamp",
-        ],
-    )
-    logger.info(
-        f"[PROFILE] fetch_bjj_schedule data parsing took {time.time() - start_time_prof:.4f} seconds"
-    )
-    return df
+    return schedule_data
 
 
-def fetch_event_clubs(event_id):
-    json_data = _fetch_participants_json(event_id)
-    seen = set()
-    clubs = []
-    for cat in json_data.get("categories", []):
-        for comp in cat.get("competitors", []):
-            academy = comp.get("academy", "").strip()
-            branch = comp.get("branch", "").strip()
-            if not academy:
-                continue
-            key = (academy, branch)
-            if key not in seen:
-                seen.add(key)
-                display = f"{academy} ({branch})" if branch else academy
-                clubs.append(
-                    {"academy": academy, "branch": branch, "display_name": display}
-                )
-    clubs.sort(key=lambda c: c["display_name"].lower())
-    return clubs
+@lru_cache(maxsize=4096)
+def _to_local_time(value):
+    """Convert a UTC DATE_FORMAT string to (epoch seconds, local "HH:MM").
 
+    Memoized per string, since refreshes of a schedule repeat the same times.
+    """
+    if DATE_FORMAT_PATTERN.fullmatch(value) is None:
+        raise ValueError(f"time data {value!r} does not match format {DATE_FORMAT!r}")
+    # fromisoformat parses the fixed-width format in C and validates field ranges.
+    timestamp = (datetime.fromisoformat(value) - UNIX_EPOCH) // timedelta(seconds=1)
+    local_minutes = (timestamp + _utc_offset(timestamp // 3600)) // 60
+    return timestamp, f"{local_minutes // 60 % 24:02d}:{local_minutes % 60:02d}"
 
-def fetch_all_tournament_ids():
-    """Fetch tournament IDs from both active and archive pages."""
-    return {
-        "active": fetch_tournament_ids(f"{BASE_URL}/pl/events"),
-        "archived": fetch_tournament_ids(f"{BASE_URL}/pl/events/archive"),
-    }
 
+@lru_cache(maxsize=1024)
+def _utc_offset(utc_hour):
+    """Return the TIMEZONE UTC offset in seconds during a given UTC hour.
 
-@cache_with_ttl(tournaments_cache)
-def fetch_tournament_ids(url):
+    Europe/Warsaw switches between CET and CEST at 01:00 UTC, so the offset
+    is constant within every UTC hour and can be cached per hour.
     """
-    Fetch tournament IDs from MartialMatch events page.
-    Results are cached to reduce API calls.
+    local_time = datetime.fromtimestamp(utc_hour * 3600, TIMEZONE)
+    return int(local_time.utcoffset().total_seconds())
+
+
+async def fetch_event_clubs(event_id):
+    index = await _fetch_participant_index(event_id)
+    watch_event(event_id)
+    return index.clubs
+
+
+async def search_event_clubs(event_id, query, limit):
+    index = await _fetch_participant_index(event_id)
+    watch_event(event_id)
+    return index.search_clubs(query, limit)
+
+
+class TournamentPage(NamedTuple):
+    tournaments: list
+    last_pages: dict  # Highest page number linked, per list path
+
+
+class _EventLinkParser(HTMLParser):
+    """Collect event links of an events page, looking at anchor tags only.
+
+    Link texts are gathered like BeautifulSoup's ``get_text`` would, without
+    the contents of scripts, styles and comments. As in its tree, an end tag
+    also closes the elements left open inside, so an anchor missing its
+    ``</a>`` ends with its enclosing element.
     """
-    soup = BeautifulSoup(make_api_request(url).text, "html.parser")
-    tournament_ids = []
+
+    def __init__(self):
+        super().__init__()
+        self.links = []  # [href, text parts] in document order
+        self.last_pages = {}
+        self._open_tags = []  # Open elements, an end tag closes the ones opened after it
+        self._anchors = []  # Open anchors, None for those that are not event links
+        self._skipped_tag = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "script" or tag == "style":
+            self._skipped_tag = tag
+        if tag in VOID_ELEMENTS:
+            return
+        self._open_tags.append(tag)
+        if tag != "a":
+            return
+        href = None
+        for name, value in attrs:
+            if name == "href":
+                href = value
+        link = None
+        if href:
+            if EVENT_HREF_PATTERN.match(href):
+                link = [href, []]
+                self.links.append(link)
+            else:
+                page_match = PAGE_HREF_PATTERN.match(href)
+                if page_match:
+                    path, page = page_match.group(1), int(page_match.group(2))
+                    self.last_pages[path] = max(page, self.last_pages.get(path, 1))
+        self._anchors.append(link)
+
+    def handle_endtag(self, tag):
+        if tag == self._skipped_tag:
+            self._skipped_tag = None
+        if tag not in self._open_tags:
+            return  # Stray end tags are ignored
+        while True:
+            open_tag = self._open_tags.pop()
+            if open_tag == "a":
+                self._anchors.pop()
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self._skipped_tag is None:
+            for link in self._anchors:
+                if link is not None:
+                    link[1].append(data)
+
+
+def _parse_tournament_page(content):
+    """Extract unique tournament IDs and names and page links from an events page."""
+    parser = _EventLinkParser()
+    parser.feed(content.decode("utf-8", errors="replace"))
+    parser.close()
+    tournaments = []
     seen_ids = set()
-    for link in soup.find_all("a", href=re.compile(r"^/pl/events/\d+.*")):
-        href = link.get("href")
-        id_match = re.search(r"/pl/events/(\d+.*?)(?:/|$)", href)
+    for href, text in parser.links:
+        id_match = EVENT_ID_PATTERN.search(href)
         if id_match and id_match.group(1) not in seen_ids:
-            name = link.text.strip()
+            name = "".join(text).strip()
             if name:
                 tournament_id = id_match.group(1)
                 seen_ids.add(tournament_id)
-                tournament_ids.append({"id": tournament_id, "name": name})
+                tournaments.append({"id": tournament_id, "name": name})
+    return TournamentPage(tournaments, parser.last_pages)
+
+
+tournament_catalog = None
+_catalog_flight = SingleFlight()
+
+
+def open_tournament_catalog():
+    """Return the catalog, loading it from TOURNAMENT_CATALOG_PATH on first use.
+
+    Without a path the catalog lives in memory and is filled on first request.
+    """
+    global tournament_catalog
+    if tournament_catalog is None:
+        tournament_catalog = TournamentCatalog(TOURNAMENT_CATALOG_PATH or ":memory:")
+    return tournament_catalog
+
+
+def close_tournament_catalog():
+    global tournament_catalog
+    if tournament_catalog is not None:
+        tournament_catalog.close()
+        tournament_catalog = None
+
+
+async def _fetch_tournament_page(url):
+    """Fetch one page of a MartialMatch events list."""
+    return await fetch_parsed(
+        url, _parse_tournament_page, max_age=TOURNAMENTS_CACHE_TTL - REFRESH_AHEAD
+    )
+
+
+async def _read_tournament_list(url, is_known=None):
+    """Read an events list page by page, following its pagination.
+
+    Stops after the first page holding a tournament ``is_known`` accepts.
+    """
+    path = url[len(BASE_URL) :]
+    tournament_ids = []
+    seen_ids = set()
+    page_url, page_number = url, 1
+    while True:
+        page = await _fetch_tournament_page(page_url)
+        for tournament in page.tournaments:
+            if tournament["id"] not in seen_ids:
+                seen_ids.add(tournament["id"])
+                tournament_ids.append(tournament)
+        if is_known and any(is_known(t["id"]) for t in page.tournaments):
+            break
+        if page_number >= min(page.last_pages.get(path, 1), TOURNAMENT_MAX_PAGES):
+            break
+        page_number += 1
+        page_url = f"{url}?page={page_number}"
     return tournament_ids
 
 
-def get_participants_schedule(event_id, academy, branch=""):
-    participants = fetch_bjj_participants(event_id, academy, branch)
-    if participants.empty:
+async def _merge_tournament_lists():
+    catalog = open_tournament_catalog()
+    active_url, archived_url = TOURNAMENT_URLS
+    active, archived = await asyncio.gather(
+        _read_tournament_list(active_url),
+        _read_tournament_list(archived_url, catalog.is_archived),
+    )
+    catalog.merge(active, archived)
+    logger.info(
+        f"Tournament catalog merged {len(active)} active and "
+        f"{len(archived)} archived tournaments"
+    )
+    return catalog
+
+
+async def refresh_tournament_catalog():
+    """Merge the active list and newly archived tournaments into the catalog."""
+    return await _catalog_flight.do_async("catalog", _merge_tournament_lists)
+
+
+async def fetch_tournament_catalog():
+    """Return the tournament catalog, filling it on first use."""
+    catalog = open_tournament_catalog()
+    if catalog.refreshed_at is None:
+        await refresh_tournament_catalog()
+    return catalog
+
+
+class EventSchedule:
+    """Schedule of every club of an event, joined and grouped by day up front.
+
+    Built once per starting-list and schedule version; serving a club is then
+    a dictionary lookup instead of a merge.
+    """
+
+    __slots__ = ("participant_index", "schedule", "by_club", "by_academy")
+
+    def __init__(self, participant_index, schedule):
+        # Referenced weakly, so evicting them from their caches frees them
+        self.participant_index = weakref.ref(participant_index)
+        self.schedule = weakref.ref(schedule)
+        with MERGE_TIME.labels("event").time():
+            slots_by_category = _slots_by_category(schedule)
+            records_by_row = {}
+            self.by_club = {
+                club: _group_by_day(rows, slots_by_category, records_by_row)
+                for club, rows in participant_index.by_club.items()
+            }
+            self.by_academy = {
+                academy: _group_by_day(rows, slots_by_category, records_by_row)
+                for academy, rows in participant_index.by_academy.items()
+            }
+
+    def cache_size(self):
+        # The index and schedule it is built from are held by their own caches
+        return deep_getsizeof((self.by_club, self.by_academy))
+
+    def is_built_from(self, participant_index, schedule):
+        return (
+            self.participant_index() is participant_index and self.schedule() is schedule
+        )
+
+    def for_club(self, academy, branch=""):
+        """Return the club's schedule grouped by day."""
+        if branch:
+            return self.by_club.get((academy, branch), {})
+        return self.by_academy.get(academy, {})
+
+
+def get_event_schedule(event_id, participant_index, schedule):
+    """Return the prebuilt EventSchedule, rebuilding it when its inputs changed."""
+    event_schedule = event_schedule_cache.get(event_id)
+    if event_schedule is None or not event_schedule.is_built_from(
+        participant_index, schedule
+    ):
+        event_schedule = EventSchedule(participant_index, schedule)
+        event_schedule_cache[event_id] = event_schedule
+    return event_schedule
+
+
+def get_timeline(event_id, schedule):
+    """Return the event's Timeline, rebuilding it when the schedule changed."""
+    timeline = timeline_cache.get(event_id)
+    if timeline is None or not timeline.is_built_from(schedule):
+        timeline = Timeline(schedule)
+        timeline_cache[event_id] = timeline
+    return timeline
+
+
+class TimelineView(NamedTuple):
+    """Slots running at a moment and the ones after, for a club or a mat."""
+
+    running: list
+    upcoming: list
+    changes_at: Optional[int]  # When a running slot ends or the next one starts
+
+
+def _timeline_row(slot, names_by_category):
+    row = {
+        "category": slot.category,
+        "mat": slot.mat,
+        "day": slot.day,
+        "time": slot.time,
+        "start_timestamp": slot.start_timestamp,
+        "end_timestamp": slot.end_timestamp,
+    }
+    if names_by_category is not None:
+        row["names"] = names_by_category[slot.category]
+    return row
+
+
+async def get_event_timeline(
+    event_id, at, academy="", branch="", mat="", limit=TIMELINE_LIMIT
+):
+    """Return the slots running at ``at`` and up to ``limit`` next ones.
+
+    With a club, these are the slots of its competitors' categories, each
+    with the competitors' names, optionally on ``mat`` only; without one,
+    every slot of ``mat``.
+    """
+    names_by_category = None
+    if academy:
+        participant_index = await _fetch_participant_index(event_id)
+        participants = participant_index.participants(academy, branch)
+        if not participants:
+            raise ParticipantsNotFoundError()
+        names_by_category = {}
+        for participant in participants:
+            names_by_category.setdefault(participant.category, []).append(participant.name)
+    watch_event(event_id)
+    schedule = await fetch_bjj_schedule(event_id)
+    if not schedule:
+        raise ScheduleNotFoundError()
+    timeline = get_timeline(event_id, schedule)
+    if names_by_category is None:
+        running, upcoming = timeline.on_mat(mat, at, limit)
+    else:
+        running, upcoming = timeline.in_categories(names_by_category, at, limit, mat)
+    changes = [slot.end_timestamp for slot in running]
+    changes.extend(slot.start_timestamp for slot in upcoming[:1])
+    return TimelineView(
+        [_timeline_row(slot, names_by_category) for slot in running],
+        [_timeline_row(slot, names_by_category) for slot in upcoming],
+        min(changes, default=None),
+    )
+
+
+def _athlete_row(athlete):
+    """Join a search hit with its category's slots, if the schedule is cached."""
+    entry = fetch_bjj_schedule.cache_entry(athlete.event_id)
+    slots = ()
+    if entry is not None and entry.value:
+        intervals = get_timeline(athlete.event_id, entry.value).by_category.get(
+            athlete.category
+        )
+        slots = intervals.slots if intervals is not None else ()
+    return {
+        "event_id": athlete.event_id,
+        "event_name": athlete_index.events[athlete.event_id].name,
+        "name": athlete.name,
+        "category": athlete.category,
+        "academy": athlete.academy,
+        "branch": athlete.branch,
+        "slots": [
+            {
+                "mat": slot.mat,
+                "day": slot.day,
+                "time": slot.time,
+                "start_timestamp": slot.start_timestamp,
+                "end_timestamp": slot.end_timestamp,
+            }
+            for slot in slots
+        ],
+    }
+
+
+def find_athletes(query, limit=ATHLETE_SEARCH_LIMIT):
+    """Return athletes of the indexed active tournaments matching ``query``,
+    each with the schedule slots of their category."""
+    return [_athlete_row(athlete) for athlete in athlete_index.search(query, limit)]
+
+
+async def get_participants_schedule(event_id, academy, branch=""):
+    participant_index = await _fetch_participant_index(event_id)
+    watch_event(event_id)
+    if not participant_index.participants(academy, branch):
         raise ParticipantsNotFoundError()
-    schedule = fetch_bjj_schedule(event_id)
-    if schedule.empty:
+    schedule = await fetch_bjj_schedule(event_id)
+    return _club_schedule(event_id, participant_index, schedule, academy, branch)
+
+
+def _club_schedule(event_id, participant_index, schedule, academy, branch):
+    if not participant_index.participants(academy, branch):
+        raise ParticipantsNotFoundError()
+    if not schedule:
         raise ScheduleNotFoundError()
-    return merge_participants_with_schedule(participants, schedule)
+    event_schedule = get_event_schedule(event_id, participant_index, schedule)
+    return event_schedule.for_club(academy, branch)
+
+
+async def _fetch_event_data(event_id):
+    """Fetch an event's starting list and schedule in parallel."""
+    results = await asyncio.gather(
+        _fetch_participant_index(event_id),
+        fetch_bjj_schedule(event_id),
+        return_exceptions=True,
+    )
+    for result in results:  # The starting list's error, e.g. event not found, first
+        if isinstance(result, Exception):
+            raise result
+    watch_event(event_id)
+    return results
+
+
+async def get_participants_schedules(clubs):
+    """Return the schedules of several (event_id, academy, branch) clubs.
+
+    Every distinct event's starting list and schedule are fetched once, all
+    events in parallel. A club that failed maps to its exception instead.
+    """
+    event_ids = list(dict.fromkeys(event_id for event_id, _, _ in clubs))
+    loaded = await asyncio.gather(
+        *(_fetch_event_data(event_id) for event_id in event_ids), return_exceptions=True
+    )
+    event_data = dict(zip(event_ids, loaded))
+    schedules = {}
+    for event_id, academy, branch in clubs:
+        data = event_data[event_id]
+        try:
+            if isinstance(data, Exception):
+                raise data
+            schedules[(event_id, academy, branch)] = _club_schedule(
+                event_id, *data, academy, branch
+            )
+        except Exception as e:
+            schedules[(event_id, academy, branch)] = e
+    return schedules
+
+
+def _slots_by_category(schedule):
+    """Group schedule slots by category name, keeping their order."""
+    slots_by_category = {}
+    for slot in schedule:
+        slots_by_category.setdefault(slot.category, []).append(slot)
+    return slots_by_category
+
+
+def _group_by_day(participants, slots_by_category, records_by_row=None):
+    """Join participants with their slots, sorted by day, start time and name.
+
+    ``records_by_row`` memoizes the joined records of identical participant
+    rows when many clubs are grouped against the same schedule.
+    """
+    if records_by_row is None:
+        records_by_row = {}
+    records = []
+    for participant in participants:
+        participant_records = records_by_row.get(participant)
+        if participant_records is None:
+            participant_records = records_by_row[participant] = [
+                {
+                    "name": participant.name,
+                    "category": participant.category,
+                    "mat": slot.mat,
+                    "day": slot.day,
+                    "time": slot.time,
+                    "start_timestamp": slot.start_timestamp,
+                    "end_timestamp": slot.end_timestamp,
+                }
+                for slot in slots_by_category.get(participant.category, ())
+            ]
+        records.extend(participant_records)
+    records.sort(key=lambda r: (r["day"], r["time"][:5], r["name"]))
+    schedule_per_day = {}
+    for record in records:
+        schedule_per_day.setdefault(record["day"], []).append(record)
+    return schedule_per_day
+
+
+def _keyed_rows(schedule_per_day):
+    """Key a club's schedule rows by competitor, category and occurrence."""
+    rows = {}
+    occurrences = {}
+    for day_rows in schedule_per_day.values():
+        for row in day_rows:
+            base = f"{row['name']}|{row['category']}"
+            occurrence = occurrences.get(base, 0)
+            occurrences[base] = occurrence + 1
+            rows[f"{base}|{occurrence}"] = row
+    return rows
+
+
+def diff_schedule_rows(old_rows, new_rows):
+    """Return the rows added, changed or removed between two keyed schedules.
+
+    Changed rows moved to another mat or time. Returns None when nothing changed.
+    """
+    added = [{**row, "key": key} for key, row in new_rows.items() if key not in old_rows]
+    changed = [
+        {**row, "key": key}
+        for key, row in new_rows.items()
+        if key in old_rows and old_rows[key] != row
+    ]
+    removed = [key for key in old_rows if key not in new_rows]
+    if not (added or changed or removed):
+        return None
+    return {"added": added, "changed": changed, "removed": removed}
 
 
 def merge_participants_with_schedule(participants, schedule):
     """Merge participants data with schedule data and group by day."""
-    schedule_per_day = {}
-    start_time_prof = time.time()
-    schedule = schedule.copy()
-    schedule["start_time"] = schedule["time"].str.extract(r"(\d{2}:\d{2}) -")
-    merged = pd.merge(participants, schedule, on="category", how="inner")
-    if merged.empty:
+    with MERGE_TIME.labels("club").time():
+        return _group_by_day(participants, _slots_by_category(schedule))
+
+
+class CacheState(NamedTuple):
+    """Freshness of the cache entries a response is built from."""
+
+    version: str
+    is_stale: bool
+    fetched_at: Optional[int]
+    max_age: int
+
+
+def _cache_state(lookups):
+    """Describe the cache entries of (cached function, args) pairs."""
+    entries = [(fetcher.cache_entry(*args), fetcher.ttl) for fetcher, args in lookups]
+    entries = [(entry, ttl) for entry, ttl in entries if entry is not None]
+    if not entries:
+        return CacheState("", False, None, 0)
+    return CacheState(
+        # From the upstream bodies, so refreshes returning unchanged data keep it
+        version=":".join(entry.version or repr(entry.fetched_at) for entry, _ in entries),
+        is_stale=any(entry.is_stale(ttl) for entry, ttl in entries),
+        fetched_at=int(min(entry.fetched_at for entry, _ in entries)),
+        max_age=max(0, int(min(ttl - entry.age() for entry, ttl in entries))),
+    )
+
+
+def get_event_freshness(event_id):
+    """Report how fresh the cached starting list and schedule of an event are."""
+    return _cache_state(
+        [(_fetch_participant_index, (event_id,)), (fetch_bjj_schedule, (event_id,))]
+    )
+
+
+def get_event_clubs_freshness(event_id):
+    """Report how fresh the cached starting list of an event is."""
+    return _cache_state([(_fetch_participant_index, (event_id,))])
+
+
+def get_tournaments_freshness():
+    """Report how fresh the tournament catalog is."""
+    catalog = open_tournament_catalog()
+    age = catalog.age()
+    if age is None:
+        return CacheState(catalog.version, False, None, 0)
+    return CacheState(
+        version=catalog.version,
+        is_stale=age >= TOURNAMENTS_CACHE_TTL,
+        fetched_at=int(catalog.refreshed_at),
+        max_age=max(0, int(TOURNAMENTS_CACHE_TTL - age)),
+    )
+
+
+def get_athletes_freshness():
+    """Report the athlete index version; it changes at most once per refresh pass."""
+    return CacheState(str(athlete_index.version), False, None, REFRESH_INTERVAL)
+
+
+def _subscribe(event_id):
+    feed = event_feeds.get(event_id)
+    if feed is None:
+        feed = event_feeds[event_id] = ChangeFeed(event_schedule_cache.get(event_id))
+    feed.subscribers += 1
+    return feed
+
+
+def _unsubscribe(event_id, feed):
+    feed.subscribers -= 1
+    if feed.subscribers == 0 and event_feeds.get(event_id) is feed:
+        del event_feeds[event_id]
+
+
+def publish_event_changes():
+    """Wake the stream subscribers of events whose data changed."""
+    for event_id, feed in list(event_feeds.items()):
+        index_entry = _fetch_participant_index.cache_entry(event_id)
+        schedule_entry = fetch_bjj_schedule.cache_entry(event_id)
+        if index_entry is None or schedule_entry is None or not schedule_entry.value:
+            continue
+        event_schedule = get_event_schedule(
+            event_id, index_entry.value, schedule_entry.value
+        )
+        if event_schedule is not feed.value:
+            feed.publish(event_schedule)
+
+
+async def stream_participants_schedule(event_id, academy, branch=""):
+    """Yield (event, data) pairs of a live subscription to a club's schedule.
+
+    The first event carries the whole schedule, later ones only the rows that
+    changed when the event's data did; (None, None) is a heartbeat. All
+    subscribers of an event share one feed, woken by the refresh scheduler,
+    so they add no upstream requests.
+    """
+    feed = _subscribe(event_id)
+    try:
+        rows = None
+        while True:
+            version = feed.version
+            message = None
+            try:
+                schedule_per_day = await get_participants_schedule(event_id, academy, branch)
+            except (ParticipantsNotFoundError, ScheduleNotFoundError) as e:
+                schedule_per_day, message = {}, str(e)
+            except EventNotFoundError as e:
+                yield "end", {"message": str(e)}
+                return
+            new_rows = _keyed_rows(schedule_per_day)
+            freshness = get_event_freshness(event_id)
+            if rows is None:
+                data = {
+                    "schedule": schedule_per_day,
+                    "is_stale": freshness.is_stale,
+                    "fetched_at": freshness.fetched_at,
+                }
+                if message:
+                    data["message"] = message
+                yield "schedule", data
+            else:
+                diff = diff_schedule_rows(rows, new_rows)
+                if diff is not None:
+                    yield "diff", {**diff, "fetched_at": freshness.fetched_at}
+            rows = new_rows
+            while not await feed.wait(version, STREAM_HEARTBEAT_INTERVAL):
+                watch_event(event_id)
+                yield None, None
+    finally:
+        _unsubscribe(event_id, feed)
+
+
+def watch_event(event_id):
+    """Mark an event as watched so the scheduler keeps its caches warm."""
+    watched_events[event_id] = True
+
+
+async def refresh_watched_events():
+    """Refresh cached data of watched events that are about to expire."""
+    for event_id in list(watched_events.keys()):
+        for fetcher in (_fetch_participant_index, fetch_bjj_schedule):
+            entry = fetcher.cache_entry(event_id)
+            if entry is not None and entry.age() < fetcher.ttl - REFRESH_AHEAD:
+                continue
+            try:
+                await fetcher.refresh(event_id)
+            except EventNotFoundError:
+                watched_events.pop(event_id, None)
+                break
+            except Exception as e:
+                logger.warning(
+                    f"Background refresh of {fetcher.__name__} for {event_id} failed: {e}"
+                )
+    publish_event_changes()
+
+
+async def refresh_stale_catalog():
+    """Merge new tournaments into the catalog when it is about to expire."""
+    age = open_tournament_catalog().age()
+    if age is not None and age < TOURNAMENTS_CACHE_TTL - REFRESH_AHEAD:
+        return
+    try:
+        await refresh_tournament_catalog()
+    except Exception as e:
+        logger.warning(f"Tournament catalog refresh failed: {e}")
+
+
+async def _index_event_athletes(tournament):
+    # Starting lists are loaded past participants_cache, so indexing does not
+    # evict the events users watch; schedules are joined only when cached
+    event_id = tournament["id"]
+    try:
+        participant_index = await _load_participant_index(event_id)
+    except EventNotFoundError:
+        athlete_index.remove(event_id)
+        return False
+    except Exception as e:
+        # Keep the athletes indexed so far; the next pass retries
+        logger.warning(f"Indexing athletes of {event_id} failed: {e}")
+        return False
+    return athlete_index.update(event_id, tournament["name"], participant_index)
+
+
+async def refresh_athlete_index():
+    """Index the athletes of the first ATHLETE_INDEX_EVENTS active tournaments.
+
+    The index keeps the starting lists it was built from, so they are
+    requested upstream again only as often as cached ones, with validators,
+    and only events whose starting list changed are indexed again.
+    """
+    tournaments = open_tournament_catalog().lists["active"][:ATHLETE_INDEX_EVENTS]
+    start = time.perf_counter()
+    athlete_index.retain({tournament["id"] for tournament in tournaments})
+    updated = await asyncio.gather(*map(_index_event_athletes, tournaments))
+    if any(updated):
         logger.info(
-            f"[PROFILE] merge_participants_with_schedule with empty merge took {time.time() - start_time_prof:.4f} seconds"
+            f"Athlete index updated {sum(updated)} of {len(tournaments)} events "
+            f"in {time.perf_counter() - start:.2f}s, {len(athlete_index)} athletes"
         )
-        return schedule_per_day
-    merged = merged.sort_values(["day", "start_time", "name"])
-    merged = merged.drop("start_time", axis=1)
-    for day, group in merged.groupby("day"):
-        schedule_per_day[day] = group.to_dict(orient="records")
-    logger.info(
-        f"[PROFILE] merge_participants_with_schedule took {time.time() - start_time_prof:.4f} seconds"
-    )
-    return schedule_per_day
+
+
+async def run_refresh_scheduler():
+    """Periodically refresh watched events, the catalog and the athlete index,
+    started from the lifespan."""
+    jobs = (refresh_watched_events, refresh_stale_catalog, refresh_athlete_index)
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        for job in jobs:
+            try:
+                await job()
+            except Exception:
+                # Keep the scheduler running, the next pass retries
+                logger.exception(f"Background {job.__name__} failed")
@@ -0,0 +1,83 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Seconds, from a cached lookup of a few microseconds to a slow upstream
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = tuple(2**exponent for exponent in range(8, 23, 2))  # 256 B to 4 MiB
+
+UPSTREAM_REQUESTS = Counter(
+    "upstream_requests",
+    "Requests sent to martialmatch.com, by outcome",
+    ["outcome"],
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries", "Upstream requests retried after a transient failure"
+)
+UPSTREAM_REJECTED = Counter(
+    "upstream_rejected", "Upstream requests failed fast while the circuit was open"
+)
+UPSTREAM_FALLBACKS = Counter(
+    "upstream_fallbacks", "Responses served from the last cached body while upstream was down"
+)
+UPSTREAM_IN_FLIGHT = Gauge("upstream_requests_in_flight", "Upstream requests in flight")
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    "upstream_circuit_state", "Upstream circuit breaker state: 0 closed, 1 half-open, 2 open"
+)
+UPSTREAM_RATE_TOKENS = Gauge(
+    "upstream_rate_limit_tokens", "Requests the upstream rate limiter allows right away"
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_seconds",
+    "Duration of upstream requests, by endpoint",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+PARSE_TIME = Histogram(
+    "upstream_parse_seconds",
+    "Time spent parsing upstream response bodies, by endpoint",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+MERGE_TIME = Histogram(
+    "schedule_merge_seconds",
+    "Time spent joining starting lists with schedules, for a whole event or one club",
+    ["scope"],
+    buckets=LATENCY_BUCKETS,
+)
+SERIALIZATION_TIME = Histogram(
+    "response_serialization_seconds",
+    "Time spent serializing and compressing response bodies, by content coding",
+    ["encoding"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "response_size_bytes",
+    "Size of JSON response bodies on the wire, by endpoint and content coding",
+    ["endpoint", "encoding"],
+    buckets=SIZE_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests", "Cache lookups, by cache and result (hit, stale, miss)", ["cache", "result"]
+)
+CACHE_EVICTIONS = Counter(
+    "cache_evictions", "Entries evicted from a full cache, by cache", ["cache"]
+)
+CACHE_SIZE = Gauge("cache_size", "Number of entries in a cache, by cache", ["cache"])
+CACHE_BYTES = Gauge(
+    "cache_bytes", "Measured size of the values in a byte-budgeted cache, by cache", ["cache"]
+)
+
+
+def instrument_cache(name, cache):
+    """Export the size and the evictions of a cachetools cache under ``name``."""
+    CACHE_SIZE.labels(name).set_function(lambda: len(cache))
+    if hasattr(cache, "max_bytes"):
+        CACHE_BYTES.labels(name).set_function(lambda: cache.currsize)
+    popitem = type(cache).popitem
+
+    # cachetools evicts through popitem() when an insert overflows maxsize
+    def counting_popitem():
+        CACHE_EVICTIONS.labels(name).inc()
+        return popitem(cache)
+
+    cache.popitem = counting_popitem
+    return cache
@@ -0,0 +1,83 @@
+import gzip
+
+import brotli
+import orjson
+from cachetools import LRUCache
+from fastapi import Response
+from metrics import SERIALIZATION_TIME, instrument_cache
+
+ENCODED_BODY_CACHE_SIZE = 500  # Maximum number of serialized response bodies
+GZIP_LEVEL = 6  # gzip compression level of cached variants
+BROTLI_QUALITY = 5  # Brotli quality of cached variants
+SUPPORTED_ENCODINGS = ("br", "gzip")  # In order of preference
+
+COMPRESSORS = {
+    "br": lambda data: brotli.compress(data, quality=BROTLI_QUALITY),
+    "gzip": lambda data: gzip.compress(data, GZIP_LEVEL, mtime=0),
+}
+
+_encoded_bodies = instrument_cache(
+    "encoded_bodies", LRUCache(maxsize=ENCODED_BODY_CACHE_SIZE)
+)
+
+
+class EncodedBody:
+    """JSON body serialized once, with compressed variants made on first use."""
+
+    __slots__ = ("identity", "_variants")
+
+    def __init__(self, content):
+        with SERIALIZATION_TIME.labels("identity").time():
+            self.identity = orjson.dumps(content)
+        self._variants = {}
+
+    def variant(self, encoding):
+        if encoding == "identity":
+            return self.identity
+        body = self._variants.get(encoding)
+        if body is None:
+            with SERIALIZATION_TIME.labels(encoding).time():
+                body = self._variants[encoding] = COMPRESSORS[encoding](self.identity)
+        return body
+
+
+def choose_encoding(accept_encoding):
+    """Pick the preferred supported content coding of an Accept-Encoding header."""
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip()] = weight
+    for encoding in SUPPORTED_ENCODINGS:
+        if weights.get(encoding, weights.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+def encoded_body(key, build):
+    """Return the serialized body stored under ``key``, building it on a miss."""
+    body = _encoded_bodies.get(key)
+    if body is None:
+        body = _encoded_bodies[key] = EncodedBody(build())
+    return body
+
+
+def encoded_json_response(body, encoding, headers):
+    """Send a variant of ``body`` with its Content-Encoding."""
+    headers = dict(headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(
+        body.variant(encoding), media_type="application/json", headers=headers
+    )
+
+
+def format_sse_event(event, data):
+    """Format a Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
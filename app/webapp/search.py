@@ -0,0 +1,46 @@
+import re
+import unicodedata
+from bisect import bisect_left
+
+WORD_PATTERN = re.compile(r"\w+")
+# Letters without a Unicode decomposition into a base letter and a diacritic
+FOLD_TABLE = str.maketrans({"ł": "l", "đ": "d", "ø": "o"})
+
+
+def fold(text):
+    """Casefold ``text`` and strip diacritics, so "Śląska" becomes "slaska"."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold().translate(FOLD_TABLE))
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def fold_words(text):
+    return WORD_PATTERN.findall(fold(text))
+
+
+class PrefixIndex:
+    """Word-prefix search over texts, each identified by a key.
+
+    Keys must be comparable with each other, e.g. positions in a list.
+    """
+
+    def __init__(self, items):
+        # Sorted (word, key) pairs; the words starting with a prefix are adjacent
+        self._entries = sorted(
+            (word, key) for key, text in items for word in set(fold_words(text))
+        )
+
+    def matches(self, query):
+        """Return keys of texts with words starting with every word of
+        ``query``, or None when the query has no words."""
+        matches = None
+        for query_word in fold_words(query):
+            found = set()
+            position = bisect_left(self._entries, (query_word,))
+            while position < len(self._entries):
+                word, key = self._entries[position]
+                if not word.startswith(query_word):
+                    break
+                found.add(key)
+                position += 1
+            matches = found if matches is None else matches & found
+        return matches
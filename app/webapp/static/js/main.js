@@ -1,5 +1,8 @@
 document.addEventListener("DOMContentLoaded", function () {
   const MAX_ACTIVE_TOURNAMENTS = 10;
+  const MAX_ARCHIVED_TOURNAMENTS = 50;
+  const SEARCH_DELAY_MS = 250;
+  const CLUB_SEARCH_LIMIT = 15;
 
   const elements = {
     form: document.getElementById("tournamentForm"),
@@ -15,15 +18,22 @@ document.addEventListener("DOMContentLoaded", function () {
     clubAcademy: document.getElementById("clubAcademy"),
     clubBranch: document.getElementById("clubBranch"),
     tournamentTypeRadios: document.getElementsByName("tournamentType"),
+    tournamentSearchWrapper: document.getElementById("tournamentSearchWrapper"),
+    tournamentSearch: document.getElementById("tournamentSearch"),
   };
 
   let tournamentData = { active: [], archived: [] };
   let currentTournaments = [];
   let selectedTournamentId = null;
+  let searchTimer = null;
+  let scheduleStream = null;
+  let streamRows = new Map();
   let serverTimestamp = null;
   let featuredClubs = [];
   let eventClubs = [];
   let eventClubsLoading = false;
+  let clubSearchTimer = null;
+  let clubSearchSeq = 0;
   let currentFiltered = [];
   let activeIndex = -1;
 
@@ -50,10 +60,10 @@ document.addEventListener("DOMContentLoaded", function () {
       </tr>`;
   }
 
-  function buildDayHtml(day, items) {
+  function buildDayHtml(day, items, isExpanded = false) {
     return `
-      <h3 class="collapsible-header collapsed">${escapeHtml(day)} <span class="collapse-indicator">&#8645;</span></h3>
-      <div class="collapsible-content" style="display: none;">
+      <h3 class="collapsible-header ${isExpanded ? "expanded" : "collapsed"}" data-day="${escapeHtml(day)}">${escapeHtml(day)} <span class="collapse-indicator">&#8645;</span></h3>
+      <div class="collapsible-content" style="display: ${isExpanded ? "block" : "none"};">
         <table>
           <thead>
             <tr>
@@ -96,7 +106,7 @@ document.addEventListener("DOMContentLoaded", function () {
     selectedTournamentId = t.id;
     elements.tournamentDisplay.textContent = t.name;
     highlightSelectedTournament();
-    loadEventClubs(t.id);
+    searchEventClubs("");
   }
 
   function updateTournamentList(showArchived) {
@@ -168,16 +178,14 @@ document.addEventListener("DOMContentLoaded", function () {
     elements.tournamentDisplay.textContent = "Pobieram...";
 
     try {
-      const response = await fetch("/api/tournaments");
-      const data = await response.json();
-      if (!response.ok) throw new Error(data.detail || "Failed to fetch tournaments");
-
-      tournamentData = data.tournaments;
+      tournamentData = await fetchTournaments("");
       updateTournamentList(false);
 
       elements.tournamentTypeRadios.forEach((radio) => {
         radio.addEventListener("change", (e) => {
-          updateTournamentList(e.target.value === "archived");
+          const showArchived = e.target.value === "archived";
+          elements.tournamentSearchWrapper.hidden = !showArchived;
+          updateTournamentList(showArchived);
         });
       });
     } catch (err) {
@@ -188,6 +196,32 @@ document.addEventListener("DOMContentLoaded", function () {
     }
   }
 
+  // The archive is searched on the server instead of shipping it whole
+  async function fetchTournaments(query) {
+    const response = await fetch(
+      `/api/tournaments?limit=${MAX_ARCHIVED_TOURNAMENTS}&q=${encodeURIComponent(query)}`
+    );
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.detail || "Failed to fetch tournaments");
+    return data.tournaments;
+  }
+
+  elements.tournamentSearch.addEventListener("input", () => {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(async () => {
+      const query = elements.tournamentSearch.value.trim();
+      try {
+        const found = await fetchTournaments(query);
+        if (query !== elements.tournamentSearch.value.trim()) return;
+        tournamentData.archived = found.archived;
+        updateTournamentList(true);
+        openTournamentDropdown();
+      } catch (err) {
+        console.error("Error searching tournaments:", err);
+      }
+    }, SEARCH_DELAY_MS);
+  });
+
   // --- Club combobox ---
 
   function isFeatured(club) {
@@ -196,12 +230,22 @@ document.addEventListener("DOMContentLoaded", function () {
     );
   }
 
+  // Lowercase without diacritics, like the server's club search
+  function fold(text) {
+    return text
+      .toLowerCase()
+      .replace(/ł/g, "l")
+      .normalize("NFD")
+      .replace(/[\u0300-\u036f]/g, "");
+  }
+
   function buildDropdownItems(query) {
-    const lower = query.toLowerCase();
-    const matches = (c) => !query || c.display_name.toLowerCase().includes(lower);
+    const folded = fold(query.trim());
+    const matches = (c) => !folded || fold(c.display_name).includes(folded);
 
+    // Event clubs come already matched and ranked by the server
     const filtered = featuredClubs.filter(matches);
-    const nonFeatured = eventClubs.filter((c) => !isFeatured(c) && matches(c));
+    const nonFeatured = eventClubs.filter((c) => !isFeatured(c));
 
     currentFiltered = [...filtered, ...nonFeatured];
     return { featured: filtered, nonFeatured };
@@ -235,6 +279,7 @@ document.addEventListener("DOMContentLoaded", function () {
         (c, i) =>
           `<li class="combobox-item" data-idx="${featured.length + i}" role="option" tabindex="-1">` +
           escapeHtml(c.display_name) +
+          `<span class="club-count">${c.competitors}</span>` +
           `</li>`
       )
       .join("");
@@ -284,6 +329,7 @@ document.addEventListener("DOMContentLoaded", function () {
   elements.clubInput.addEventListener("focus", () => {
     elements.clubInput.select();
     renderDropdown("");
+    searchEventClubs("");
   });
 
   elements.clubInput.addEventListener("click", () => {
@@ -293,6 +339,11 @@ document.addEventListener("DOMContentLoaded", function () {
   elements.clubInput.addEventListener("input", () => {
     clearSelection();
     renderDropdown(elements.clubInput.value);
+    clearTimeout(clubSearchTimer);
+    clubSearchTimer = setTimeout(
+      () => searchEventClubs(elements.clubInput.value.trim()),
+      SEARCH_DELAY_MS
+    );
   });
 
   elements.clubInput.addEventListener("blur", () => {
@@ -344,7 +395,10 @@ document.addEventListener("DOMContentLoaded", function () {
     }
   }
 
-  async function loadEventClubs(eventId) {
+  // Only the best matches of the typed text are downloaded, not every club
+  async function searchEventClubs(query) {
+    const eventId = selectedTournamentId;
+    const seq = ++clubSearchSeq;
     if (!eventId) {
       eventClubs = [];
       return;
@@ -354,19 +408,19 @@ document.addEventListener("DOMContentLoaded", function () {
 
     try {
       const response = await fetch(
-        `/api/event-clubs?event_id=${encodeURIComponent(eventId)}`
+        `/api/event-clubs/search?event_id=${encodeURIComponent(eventId)}` +
+          `&q=${encodeURIComponent(query)}&limit=${CLUB_SEARCH_LIMIT}`
       );
       const data = await response.json();
-      if (eventId === selectedTournamentId) {
-        eventClubs = response.ok ? data.clubs || [] : [];
-      }
+      if (seq !== clubSearchSeq) return;
+      eventClubs = response.ok ? data.clubs || [] : [];
     } catch (err) {
-      if (eventId === selectedTournamentId) eventClubs = [];
-      console.error("Error fetching event clubs:", err);
-    } finally {
-      eventClubsLoading = false;
-      if (!elements.clubDropdown.hidden) renderDropdown(elements.clubInput.value);
+      if (seq !== clubSearchSeq) return;
+      eventClubs = [];
+      console.error("Error searching event clubs:", err);
     }
+    eventClubsLoading = false;
+    if (!elements.clubDropdown.hidden) renderDropdown(elements.clubInput.value);
   }
 
   // --- Form submit ---
@@ -390,6 +444,7 @@ document.addEventListener("DOMContentLoaded", function () {
       return;
     }
 
+    if (scheduleStream) scheduleStream.close();
     elements.loading.style.display = "block";
     elements.results.style.display = "none";
     elements.error.style.display = "none";
@@ -399,22 +454,18 @@ document.addEventListener("DOMContentLoaded", function () {
         `/api/participants?event_id=${encodeURIComponent(eventId)}` +
         `&academy=${encodeURIComponent(academy)}` +
         `&branch=${encodeURIComponent(branch)}`;
-      const response = await fetch(url);
+      // Always revalidate: the browser sends the stored ETag and reuses its
+      // copy when the server answers 304.
+      const response = await fetch(url, { cache: "no-cache" });
       const data = await response.json();
       if (!response.ok) throw new Error(data.detail || "An error occurred");
 
-      if (Object.keys(data.schedule).length === 0) {
-        const message = data.message || "Nie znaleziono danych.";
-        elements.scheduleContainer.innerHTML = `<div class="error">${escapeHtml(message)}</div>`;
-      } else {
-        elements.scheduleContainer.innerHTML = Object.entries(data.schedule)
-          .filter(([, items]) => items && items.length > 0)
-          .map(([day, items]) => buildDayHtml(day, items))
-          .join("");
-      }
-
-      addCollapsibleBehavior();
+      renderSchedule(data.schedule, data.message);
       elements.results.style.display = "block";
+      followSchedule(
+        url.replace("/api/participants?", "/api/participants/stream?"),
+        data.schedule
+      );
     } catch (err) {
       elements.error.textContent = err.message;
       elements.error.style.display = "block";
@@ -423,6 +474,77 @@ document.addEventListener("DOMContentLoaded", function () {
     }
   }
 
+  function renderSchedule(schedule, message) {
+    if (Object.keys(schedule).length === 0) {
+      const text = message || "Nie znaleziono danych.";
+      elements.scheduleContainer.innerHTML = `<div class="error">${escapeHtml(text)}</div>`;
+      return;
+    }
+    const expandedDays = new Set(
+      [...elements.scheduleContainer.querySelectorAll(".collapsible-header.expanded")].map(
+        (header) => header.dataset.day
+      )
+    );
+    elements.scheduleContainer.innerHTML = Object.entries(schedule)
+      .filter(([, items]) => items && items.length > 0)
+      .map(([day, items]) => buildDayHtml(day, items, expandedDays.has(day)))
+      .join("");
+    addCollapsibleBehavior();
+  }
+
+  // --- Live updates ---
+
+  // Rows are keyed like the server does: name, category and occurrence
+  function keyRows(schedule) {
+    const rows = new Map();
+    const occurrences = {};
+    Object.values(schedule).forEach((items) =>
+      items.forEach((item) => {
+        const base = `${item.name}|${item.category}`;
+        const occurrence = occurrences[base] || 0;
+        occurrences[base] = occurrence + 1;
+        rows.set(`${base}|${occurrence}`, item);
+      })
+    );
+    return rows;
+  }
+
+  function groupRows(rows) {
+    const compare = (a, b) => (a < b ? -1 : a > b ? 1 : 0);
+    const sorted = [...rows].sort(
+      (a, b) =>
+        compare(a.day, b.day) ||
+        compare(a.time.slice(0, 5), b.time.slice(0, 5)) ||
+        compare(a.name, b.name)
+    );
+    const schedule = {};
+    sorted.forEach((row) => (schedule[row.day] = schedule[row.day] || []).push(row));
+    return schedule;
+  }
+
+  function followSchedule(url, renderedSchedule) {
+    if (scheduleStream) scheduleStream.close();
+    scheduleStream = new EventSource(url);
+    let renderedJson = JSON.stringify(renderedSchedule);
+    // Sent on every (re)connect; usually it repeats what is already shown
+    scheduleStream.addEventListener("schedule", (e) => {
+      const data = JSON.parse(e.data);
+      streamRows = keyRows(data.schedule);
+      const json = JSON.stringify(data.schedule);
+      if (json !== renderedJson) renderSchedule(data.schedule, data.message);
+      renderedJson = json;
+    });
+    scheduleStream.addEventListener("diff", (e) => {
+      const diff = JSON.parse(e.data);
+      diff.removed.forEach((key) => streamRows.delete(key));
+      [...diff.added, ...diff.changed].forEach(({ key, ...row }) => streamRows.set(key, row));
+      const schedule = groupRows(streamRows.values());
+      renderSchedule(schedule);
+      renderedJson = JSON.stringify(schedule);
+    });
+    scheduleStream.addEventListener("end", () => scheduleStream.close());
+  }
+
   function addCollapsibleBehavior() {
     document.querySelectorAll(".collapsible-header").forEach((header) => {
       header.addEventListener("click", function () {
@@ -0,0 +1,77 @@
+from athletes import AthleteIndex
+from martialmatch_scraper import ParticipantIndex
+
+
+def _starting_list(*competitors):
+    return ParticipantIndex(
+        {
+            "categories": [
+                {
+                    "category": category,
+                    "competitors": [
+                        {"firstName": first, "lastName": last, "academy": academy}
+                    ],
+                }
+                for first, last, category, academy in competitors
+            ]
+        }
+    )
+
+
+FIRST = _starting_list(
+    ("Łukasz", "Wiśniewski", "adult -76 kg", "Gorila"),
+    ("Anna", "Nowak", "adult -58 kg", "Checkmat"),
+)
+SECOND = _starting_list(("Łukasz", "Nowak", "master -82 kg", "Gorila"))
+
+
+def _index():
+    index = AthleteIndex()
+    index.update("1", "Puchar Polski", FIRST)
+    index.update("2", "Łódź Open", SECOND)
+    return index
+
+
+def test_event_words_are_folded_and_sorted():
+    assert _index().events["1"].words == ["anna", "lukasz", "nowak", "wisniewski"]
+
+
+def test_search_matches_name_word_prefixes_across_events():
+    index = _index()
+    assert [(a.event_id, a.name) for a in index.search("luk", 10)] == [
+        ("2", "Łukasz Nowak"),
+        ("1", "Łukasz Wiśniewski"),
+    ]
+    assert [a.name for a in index.search("nowak luk", 10)] == ["Łukasz Nowak"]
+    assert [a.category for a in index.search("WISN", 10)] == ["adult -76 kg"]
+    assert index.search("nowak", 1) == index.search("nowak", 10)[:1]
+    assert index.search("kowalski", 10) == []
+    assert index.search(" ", 10) == []
+
+
+def test_name_with_two_matching_words_is_found_once():
+    index = AthleteIndex()
+    index.update("1", "Puchar Polski", _starting_list(("Ola", "Nowak-Nowakowska", "kids", "")))
+    assert len(index.search("nowak", 10)) == 1
+
+
+def test_update_replaces_only_a_changed_event():
+    index = _index()
+    version = index.version
+    assert not index.update("1", "Puchar Polski", FIRST)
+    assert index.version == version
+    assert index.update("2", "Łódź Open", _starting_list(("Ewa", "Mazur", "kids", "Gorila")))
+    assert [a.event_id for a in index.search("nowak", 10)] == ["1"]
+    assert [a.event_id for a in index.search("ewa", 10)] == ["2"]
+    assert len(index) == 3
+
+
+def test_retain_drops_events():
+    index = _index()
+    index.retain({"2"})
+    assert list(index.events) == ["2"]
+    assert index.search("anna", 10) == []
+    version = index.version
+    index.retain(())
+    assert len(index) == 0 and index.events == {}
+    assert index.version == version + 1
@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from cache import SQLiteCache, cache_with_ttl, report_fetched_at
+from cachetools import TTLCache
+from metrics import CACHE_EVICTIONS, CACHE_REQUESTS
+
+CONCURRENT_CALLERS = 100
+
+
+def test_async_concurrent_misses_make_one_upstream_call():
+    calls = []
+
+    @cache_with_ttl(TTLCache(maxsize=10, ttl=60))
+    async def fetch(event_id):
+        calls.append(event_id)
+        await asyncio.sleep(0.05)
+        return {"event": event_id}
+
+    async def run():
+        return await asyncio.gather(
+            *(fetch("123") for _ in range(CONCURRENT_CALLERS))
+        )
+
+    results = asyncio.run(run())
+    assert calls == ["123"]
+    assert all(result == {"event": "123"} for result in results)
+
+
+def test_async_concurrent_misses_share_failure():
+    calls = []
+
+    @cache_with_ttl(TTLCache(maxsize=10, ttl=60))
+    async def fetch(event_id):
+        calls.append(event_id)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(
+            *(fetch("123") for _ in range(CONCURRENT_CALLERS)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_async_distinct_keys_are_not_coalesced():
+    calls = []
+
+    @cache_with_ttl(TTLCache(maxsize=10, ttl=60))
+    async def fetch(event_id):
+        calls.append(event_id)
+        await asyncio.sleep(0.01)
+        return event_id
+
+    async def run():
+        return await asyncio.gather(fetch("1"), fetch("2"), fetch("1"))
+
+    assert asyncio.run(run()) == ["1", "2", "1"]
+    assert sorted(calls) == ["1", "2"]
+
+
+def test_sync_concurrent_misses_make_one_upstream_call():
+    calls = []
+    barrier = threading.Barrier(CONCURRENT_CALLERS)
+
+    @cache_with_ttl(TTLCache(maxsize=10, ttl=60))
+    def fetch(event_id):
+        calls.append(event_id)
+        time.sleep(0.05)
+        return {"event": event_id}
+
+    def call():
+        barrier.wait()
+        return fetch("123")
+
+    with ThreadPoolExecutor(max_workers=CONCURRENT_CALLERS) as pool:
+        results = list(pool.map(lambda _: call(), range(CONCURRENT_CALLERS)))
+
+    assert calls == ["123"]
+    assert all(result == {"event": "123"} for result in results)
+
+
+def test_sync_concurrent_misses_share_failure():
+    calls = []
+    barrier = threading.Barrier(CONCURRENT_CALLERS)
+
+    @cache_with_ttl(TTLCache(maxsize=10, ttl=60))
+    def fetch(event_id):
+        calls.append(event_id)
+        time.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    def call():
+        barrier.wait()
+        with pytest.raises(RuntimeError):
+            fetch("123")
+
+    with ThreadPoolExecutor(max_workers=CONCURRENT_CALLERS) as pool:
+        list(pool.map(lambda _: call(), range(CONCURRENT_CALLERS)))
+
+    assert calls == ["123"]
+
+
+def _age_entries(cache, seconds):
+    for entry in cache.values():
+        entry.fetched_at -= seconds
+
+
+def test_stale_entry_is_served_while_refreshing_in_background():
+    cache = TTLCache(maxsize=10, ttl=3600)
+    values = iter(["first", "second"])
+
+    @cache_with_ttl(cache, ttl=60)
+    async def fetch(event_id):
+        return next(values)
+
+    async def run():
+        assert await fetch("123") == "first"
+        _age_entries(cache, 61)
+        assert fetch.cache_entry("123").is_stale(fetch.ttl)
+        assert await fetch("123") == "first"
+        await asyncio.sleep(0.01)
+        return await fetch("123")
+
+    assert asyncio.run(run()) == "second"
+    assert not fetch.cache_entry("123").is_stale(fetch.ttl)
+
+
+def test_failed_background_refresh_keeps_stale_entry():
+    cache = TTLCache(maxsize=10, ttl=3600)
+    responses = iter([lambda: "first", lambda: 1 / 0])
+
+    @cache_with_ttl(cache, ttl=60)
+    async def fetch(event_id):
+        return next(responses)()
+
+    async def run():
+        await fetch("123")
+        _age_entries(cache, 61)
+        assert await fetch("123") == "first"
+        await asyncio.sleep(0.01)
+        return await fetch("123")
+
+    assert asyncio.run(run()) == "first"
+    assert fetch.cache_entry("123").is_stale(fetch.ttl)
+
+
+def test_refresh_replaces_entry():
+    values = iter(["first", "second"])
+
+    @cache_with_ttl(TTLCache(maxsize=10, ttl=3600), ttl=60)
+    async def fetch(event_id):
+        return next(values)
+
+    async def run():
+        await fetch("123")
+        assert await fetch.refresh("123") == "second"
+        return await fetch("123")
+
+    assert asyncio.run(run()) == "second"
+
+
+def test_entry_is_stamped_with_reported_fetch_time():
+    @cache_with_ttl(TTLCache(maxsize=10, ttl=3600), ttl=60)
+    async def fetch(event_id):
+        report_fetched_at(1000.0)
+        return event_id
+
+    asyncio.run(fetch("123"))
+    assert fetch.cache_entry("123").fetched_at == 1000.0
+
+
+def test_sqlite_cache_expires_entries_and_locks(tmp_path):
+    backend = SQLiteCache(str(tmp_path / "l2.db"))
+    other_replica = SQLiteCache(str(tmp_path / "l2.db"))
+
+    async def run():
+        await backend.set("key", b"value", 60)
+        await backend.set("expired", b"value", -1)
+        assert await other_replica.get("key") == b"value"
+        assert await other_replica.get("expired") is None
+
+        token = await backend.acquire_lock("lock", 60)
+        assert token is not None
+        assert await other_replica.acquire_lock("lock", 60) is None
+        await other_replica.release_lock("lock", b"not-the-owner")
+        assert await other_replica.acquire_lock("lock", 60) is None
+        await backend.release_lock("lock", token)
+        assert await other_replica.acquire_lock("lock", 60) is not None
+
+    asyncio.run(run())
+    asyncio.run(backend.close())
+    asyncio.run(other_replica.close())
+
+
+def test_sqlite_cache_extends_only_held_locks(tmp_path):
+    backend = SQLiteCache(str(tmp_path / "l2.db"))
+
+    async def run():
+        token = await backend.acquire_lock("lock", 0.1)
+        await backend.extend_lock("lock", b"not-the-owner", 60)
+        await asyncio.sleep(0.15)
+        assert await backend.get("lock") is None
+        token = await backend.acquire_lock("lock", 0.1)
+        await backend.extend_lock("lock", token, 60)
+        await asyncio.sleep(0.15)
+        assert await backend.get("lock") == token
+
+    asyncio.run(run())
+    asyncio.run(backend.close())
+
+
+def test_cached_function_counts_lookups_and_evictions():
+    @cache_with_ttl(TTLCache(maxsize=1, ttl=60))
+    def counted(event_id):
+        return event_id
+
+    counted("1")
+    counted("1")
+    counted("2")
+
+    def value(metric, *labels):
+        return metric.labels("counted", *labels)._value.get()
+
+    assert value(CACHE_REQUESTS, "miss") == 2
+    assert value(CACHE_REQUESTS, "hit") == 1
+    assert value(CACHE_EVICTIONS) == 1
@@ -0,0 +1,55 @@
+from catalog import TournamentCatalog
+
+
+def _tournaments(*names):
+    return [{"id": str(i), "name": name} for i, name in enumerate(names, start=1)]
+
+
+def test_catalog_persists_between_restarts(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    catalog = TournamentCatalog(path)
+    catalog.merge(_tournaments("Puchar Polski"), [])
+    version = catalog.version
+    catalog.close()
+
+    restored = TournamentCatalog(path)
+    assert restored.lists["active"] == [{"id": "1", "name": "Puchar Polski"}]
+    assert restored.refreshed_at is not None
+    assert restored.version == version
+    restored.close()
+
+
+def test_catalog_places_newly_archived_first_and_updates_names():
+    catalog = TournamentCatalog()
+    catalog.merge([], [{"id": "2", "name": "Old"}, {"id": "1", "name": "Older"}])
+    catalog.merge([], [{"id": "3", "name": "New"}, {"id": "2", "name": "Old (renamed)"}])
+
+    assert catalog.lists["archived"] == [
+        {"id": "3", "name": "New"},
+        {"id": "2", "name": "Old (renamed)"},
+        {"id": "1", "name": "Older"},
+    ]
+    assert catalog.is_archived("1")
+    catalog.close()
+
+
+def test_catalog_search_matches_word_prefixes_per_status():
+    catalog = TournamentCatalog()
+    catalog.merge(
+        [{"id": "10", "name": "Puchar Śląska"}],
+        _tournaments("Puchar Polski Open", "Warsaw Open", "Poznań Cup"),
+    )
+
+    assert catalog.search("po") == {
+        "active": [],
+        "archived": [
+            {"id": "1", "name": "Puchar Polski Open"},
+            {"id": "3", "name": "Poznań Cup"},
+        ],
+    }
+    assert catalog.search("puchar ŚLĄ")["active"] == [{"id": "10", "name": "Puchar Śląska"}]
+    assert catalog.search("open", limit=1)["archived"] == [
+        {"id": "1", "name": "Puchar Polski Open"}
+    ]
+    assert catalog.search("")["archived"][2]["id"] == "3"
+    catalog.close()
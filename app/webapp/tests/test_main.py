@@ -1,10 +1,20 @@
+import asyncio
+import copy
+import json
 from unittest.mock import MagicMock, patch
 
 import pytest
+import response_bodies
+import utils
 from fastapi.testclient import TestClient
 from main import app
-from martialmatch_scraper import (ALLOWED_CLUBS, participants_cache,
-                                  schedule_cache, tournaments_cache)
+from martialmatch_scraper import (ALLOWED_CLUBS, SCHEDULE_CACHE_TTL,
+                                  athlete_index, event_schedule_cache,
+                                  fetch_bjj_schedule, fetch_tournament_catalog,
+                                  participants_cache, refresh_athlete_index,
+                                  refresh_watched_events,
+                                  close_tournament_catalog, schedule_cache,
+                                  timeline_cache, watched_events)
 from utils import EventNotFoundHTTPError
 
 client = TestClient(app)
@@ -58,12 +68,15 @@ MOCK_TOURNAMENTS_HTML = '<a href="/pl/events/123-test-tournament">Test Tournamen
 
 def _make_response(json_data=None, text=""):
     mock = MagicMock()
+    mock.status_code = 200
+    mock.headers = {}
     mock.json.return_value = json_data or {}
     mock.text = text
+    mock.content = json.dumps(json_data).encode() if json_data else text.encode()
     return mock
 
 
-def _mock_api(url, cookies=None):
+def _mock_api(url, cookies=None, headers=None):
     if "starting-lists" in url:
         return _make_response(json_data=MOCK_PARTICIPANTS_JSON)
     if "schedules" in url:
@@ -71,11 +84,54 @@ def _mock_api(url, cookies=None):
     return _make_response(text=MOCK_TOURNAMENTS_HTML)
 
 
-@pytest.fixture(autouse=True)
-def clear_caches():
+def _age_schedule(seconds):
+    """Pretend the cached schedule was fetched ``seconds`` earlier."""
+    for entry in schedule_cache.values():
+        entry.fetched_at -= seconds
+    for url, record in utils._upstream_records.items():
+        if url.endswith("/schedules"):
+            record.fetched_at -= seconds
+
+
+def _clear_in_memory_caches():
     participants_cache.clear()
     schedule_cache.clear()
-    tournaments_cache.clear()
+    close_tournament_catalog()
+    event_schedule_cache.clear()
+    timeline_cache.clear()
+    watched_events.clear()
+    athlete_index.retain(())
+    utils._upstream_records.clear()
+    response_bodies._encoded_bodies.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    _clear_in_memory_caches()
+
+
+def test_lifespan_manages_http_client():
+    with TestClient(app) as lifespan_client:
+        assert lifespan_client.get("/health").status_code == 200
+        assert utils._http_client is not None
+    assert utils._http_client is None
+
+
+def test_restart_serves_first_request_from_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "CACHE_SNAPSHOT_PATH", str(tmp_path / "snapshot.bin"))
+    params = {"event_id": "123", "academy": VALID_ACADEMY, "branch": VALID_BRANCH}
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        with TestClient(app) as first_run:
+            assert first_run.get("/api/participants", params=params).status_code == 200
+    _clear_in_memory_caches()
+
+    with patch(
+        "utils.make_api_request", side_effect=Exception("upstream down")
+    ) as mock_request:
+        with TestClient(app) as second_run:
+            response = second_run.get("/api/participants", params=params)
+    assert mock_request.call_count == 0
+    assert response.json()["schedule"]["Dzień 1"][0]["name"] == "Anna Testowa"
 
 
 def test_get_clubs():
@@ -90,7 +146,7 @@ def test_get_clubs():
 
 
 def test_get_tournaments():
-    with patch("martialmatch_scraper.make_api_request", side_effect=_mock_api):
+    with patch("utils.make_api_request", side_effect=_mock_api):
         response = client.get("/api/tournaments")
     assert response.status_code == 200
     tournaments = response.json()["tournaments"]
@@ -100,8 +156,109 @@ def test_get_tournaments():
             assert "id" in t and "name" in t
 
 
+def test_get_tournaments_filters_by_name_server_side():
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        matching = client.get("/api/tournaments", params={"q": "test"})
+        other = client.get("/api/tournaments", params={"q": "other"})
+    assert matching.json()["tournaments"]["active"] == [
+        {"id": "123-test-tournament", "name": "Test Tournament"}
+    ]
+    assert other.json()["tournaments"] == {"active": [], "archived": []}
+
+
+def test_metrics_count_cache_lookups_and_response_sizes():
+    params = {"event_id": "123", "academy": VALID_ACADEMY, "branch": VALID_BRANCH}
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        client.get("/api/participants", params=params)
+        client.get("/api/participants", params=params)
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
+    body = metrics.text
+    assert 'cache_requests_total{cache="fetch_bjj_schedule",result="miss"}' in body
+    assert 'cache_requests_total{cache="fetch_bjj_schedule",result="hit"}' in body
+    assert 'response_size_bytes_count{encoding="br",endpoint="participants"}' in body
+    assert 'schedule_merge_seconds_count{scope="event"}' in body
+
+
+def test_get_event_clubs():
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        response = client.get("/api/event-clubs", params={"event_id": "123"})
+    assert response.status_code == 200
+    assert response.json()["clubs"] == [
+        {
+            "academy": "Academia Gorila",
+            "branch": "Warszawa",
+            "display_name": "Academia Gorila (Warszawa)",
+        }
+    ]
+
+
+def test_search_event_clubs_folds_diacritics():
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        found = client.get("/api/event-clubs/search", params={"event_id": "123", "q": "gori"})
+        missing = client.get("/api/event-clubs/search", params={"event_id": "123", "q": "x"})
+    assert found.status_code == 200
+    assert found.json()["clubs"] == [
+        {
+            "academy": "Academia Gorila",
+            "branch": "Warszawa",
+            "display_name": "Academia Gorila (Warszawa)",
+            "competitors": 1,
+        }
+    ]
+    assert missing.json()["clubs"] == []
+
+
+SLOT_START = 1704103200  # 2024-01-01 10:00 UTC, the mock slot runs 30 minutes
+
+
+def test_timeline_returns_running_club_slot_until_it_ends():
+    params = {"event_id": "123", "academy": VALID_ACADEMY, "branch": VALID_BRANCH}
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        before = client.get("/api/timeline", params={**params, "at": SLOT_START - 60})
+        during = client.get("/api/timeline", params={**params, "at": SLOT_START + 600})
+    assert before.json()["now"] == []
+    assert before.json()["next"][0]["names"] == ["Anna Testowa"]
+    assert during.json()["now"][0]["mat"] == "Mata 1"
+    assert during.json()["next"] == []
+    # Clients may keep the body until the slot starts
+    assert before.headers["Cache-Control"].startswith("public, max-age=60,")
+
+
+def test_timeline_of_mat_and_without_club_or_mat():
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        mat = client.get(
+            "/api/timeline", params={"event_id": "123", "mat": "Mata 1", "at": SLOT_START}
+        )
+        missing = client.get("/api/timeline", params={"event_id": "123"})
+    assert mat.json()["now"][0]["category"] == "adult; kobiety; -58 kg"
+    assert "names" not in mat.json()["now"][0]
+    assert missing.status_code == 400
+
+
+def test_athlete_search_joins_active_events_with_schedules():
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        asyncio.run(fetch_tournament_catalog())
+        asyncio.run(refresh_athlete_index())
+        unscheduled = client.get("/api/athletes/search", params={"q": "testow an"})
+        asyncio.run(fetch_bjj_schedule("123-test-tournament"))  # Viewed by a user
+        response = client.get("/api/athletes/search", params={"q": "testow an"})
+        missing = client.get("/api/athletes/search", params={"q": "kowalski"})
+    # Indexing leaves the caches of the events users watch alone
+    assert len(participants_cache) == 0
+    assert unscheduled.json()["athletes"][0]["slots"] == []
+    athletes = response.json()["athletes"]
+    assert [(a["event_name"], a["name"], a["academy"]) for a in athletes] == [
+        ("Test Tournament", "Anna Testowa", "Academia Gorila")
+    ]
+    assert athletes[0]["slots"][0]["mat"] == "Mata 1"
+    assert missing.json() == {"athletes": []}
+    assert client.get("/api/athletes/search", params={"q": "an"}).status_code == 422
+
+
 def test_get_participants_returns_merged_schedule():
-    with patch("martialmatch_scraper.make_api_request", side_effect=_mock_api):
+    with patch("utils.make_api_request", side_effect=_mock_api):
         response = client.get(
             "/api/participants",
             params={
@@ -120,16 +277,126 @@ def test_get_participants_returns_merged_schedule():
     assert "time" in item
     assert "start_timestamp" in item
     assert "end_timestamp" in item
+    assert response.json()["is_stale"] is False
+    assert isinstance(response.json()["fetched_at"], int)
+
+
+def test_get_participants_serves_stale_schedule_when_upstream_fails():
+    params = {"event_id": "123", "academy": VALID_ACADEMY, "branch": VALID_BRANCH}
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        client.get("/api/participants", params=params)
+    _age_schedule(SCHEDULE_CACHE_TTL + 1)
+
+    with patch(
+        "utils.make_api_request", side_effect=Exception("upstream down")
+    ):
+        response = client.get("/api/participants", params=params)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["schedule"]["Dzień 1"][0]["name"] == "Anna Testowa"
+    assert data["is_stale"] is True
+
+
+def test_get_participants_answers_matching_etag_with_304():
+    params = {"event_id": "123", "academy": VALID_ACADEMY, "branch": VALID_BRANCH}
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        first = client.get("/api/participants", params=params)
+        etag = first.headers["ETag"]
+        second = client.get(
+            "/api/participants", params=params, headers={"If-None-Match": etag}
+        )
+        other_club = client.get(
+            "/api/participants",
+            params={**params, "branch": "Kraków"},
+            headers={"If-None-Match": etag},
+        )
+    assert first.status_code == 200
+    assert "max-age=" in first.headers["Cache-Control"]
+    assert f"stale-while-revalidate={SCHEDULE_CACHE_TTL}" in first.headers["Cache-Control"]
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["ETag"] == etag
+    assert other_club.headers.get("ETag") != etag
+
+
+@pytest.mark.parametrize("accept_encoding", ["br", "gzip", "identity"])
+def test_get_participants_serves_body_serialized_once_per_version(accept_encoding):
+    params = {"event_id": "123", "academy": VALID_ACADEMY, "branch": VALID_BRANCH}
+    headers = {"Accept-Encoding": accept_encoding}
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        first = client.get("/api/participants", params=params, headers=headers)
+        second = client.get("/api/participants", params=params, headers=headers)
+    assert first.headers.get("Content-Encoding", "identity") == accept_encoding
+    assert first.headers["Vary"] == "Accept-Encoding"
+    assert first.json() == second.json()
+    assert first.json()["schedule"]["Dzień 1"][0]["name"] == "Anna Testowa"
+    assert len(response_bodies._encoded_bodies) == 1
+
+
+def test_get_participants_etag_changes_only_when_refetched_schedule_changed():
+    params = {"event_id": "123", "academy": VALID_ACADEMY, "branch": VALID_BRANCH}
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        etag = client.get("/api/participants", params=params).headers["ETag"]
+        _age_schedule(SCHEDULE_CACHE_TTL)
+        asyncio.run(fetch_bjj_schedule.refresh("123"))
+        unchanged = client.get(
+            "/api/participants", params=params, headers={"If-None-Match": etag}
+        )
+    changed_schedule = copy.deepcopy(MOCK_SCHEDULE_JSON)
+    changed_schedule["schedules"][0]["mats"][0]["name"] = "Mata 5"
+
+    def mock_changed(url, cookies=None, headers=None):
+        if "schedules" in url:
+            return _make_response(json_data=changed_schedule)
+        return _mock_api(url, cookies, headers)
+
+    with patch("utils.make_api_request", side_effect=mock_changed):
+        _age_schedule(SCHEDULE_CACHE_TTL)
+        asyncio.run(fetch_bjj_schedule.refresh("123"))
+        changed = client.get(
+            "/api/participants", params=params, headers={"If-None-Match": etag}
+        )
+    assert unchanged.status_code == 304
+    assert unchanged.headers["ETag"] == etag
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["schedule"]["Dzień 1"][0]["mat"] == "Mata 5"
+
+
+def test_get_tournaments_and_event_clubs_answer_304():
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        for url, params in (
+            ("/api/tournaments", None),
+            ("/api/event-clubs", {"event_id": "123"}),
+        ):
+            etag = client.get(url, params=params).headers["ETag"]
+            response = client.get(url, params=params, headers={"If-None-Match": etag})
+            assert response.status_code == 304
+
+
+def test_refresh_watched_events_reloads_expiring_entries():
+    params = {"event_id": "123", "academy": VALID_ACADEMY, "branch": VALID_BRANCH}
+    with patch("utils.make_api_request", side_effect=_mock_api):
+        client.get("/api/participants", params=params)
+    assert "123" in watched_events
+    _age_schedule(SCHEDULE_CACHE_TTL)
+
+    with patch(
+        "utils.make_api_request", side_effect=_mock_api
+    ) as mock_request:
+        asyncio.run(refresh_watched_events())
+    refreshed_urls = [call.args[0] for call in mock_request.call_args_list]
+    assert refreshed_urls == ["https://martialmatch.com/api/events/123/schedules"]
 
 
 def test_get_participants_no_matching_competitors():
-    def mock_no_competitors(url, cookies=None):
+    def mock_no_competitors(url, cookies=None, headers=None):
         if "starting-lists" in url:
             return _make_response(json_data={"categories": []})
         return _make_response(json_data=MOCK_SCHEDULE_JSON)
 
     with patch(
-        "martialmatch_scraper.make_api_request", side_effect=mock_no_competitors
+        "utils.make_api_request", side_effect=mock_no_competitors
     ):
         response = client.get(
             "/api/participants",
@@ -147,7 +414,7 @@ def test_get_participants_no_matching_competitors():
 
 def test_get_participants_event_not_found():
     with patch(
-        "martialmatch_scraper.make_api_request", side_effect=EventNotFoundHTTPError
+        "utils.make_api_request", side_effect=EventNotFoundHTTPError
     ):
         response = client.get(
             "/api/participants",
@@ -163,6 +430,33 @@ def test_get_participants_event_not_found():
     assert "message" in data
 
 
+def test_get_participants_batch_fetches_each_event_once():
+    def mock_api(url, cookies=None, headers=None):
+        if "/999/" in url:
+            raise EventNotFoundHTTPError()
+        return _mock_api(url)
+
+    clubs = [
+        {"event_id": "123", "academy": VALID_ACADEMY, "branch": VALID_BRANCH},
+        {"event_id": "123", "academy": VALID_ACADEMY, "branch": "Ruda Śląska"},
+        {"event_id": "123", "academy": VALID_ACADEMY},
+        {"event_id": "999", "academy": VALID_ACADEMY, "branch": VALID_BRANCH},
+        {"event_id": "123"},
+    ]
+    with patch("utils.make_api_request", side_effect=mock_api) as mock_request:
+        response = client.post("/api/participants/batch", json={"clubs": clubs})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    schedule = results[f"123|{VALID_ACADEMY}|{VALID_BRANCH}"]["schedule"]
+    assert schedule["Dzień 1"][0]["name"] == "Anna Testowa"
+    assert results[f"123|{VALID_ACADEMY}|"]["schedule"] == schedule
+    assert results[f"123|{VALID_ACADEMY}|Ruda Śląska"]["schedule"] == {}
+    assert results[f"999|{VALID_ACADEMY}|{VALID_BRANCH}"]["message"] == "Nie znaleziono turnieju"
+    assert "error" in results["123||"]
+    # The starting list and the schedule of each event
+    assert mock_request.call_count == 4
+
+
 @pytest.mark.parametrize(
     "event_id,academy,branch",
     [
@@ -0,0 +1,523 @@
+import asyncio
+import copy
+import json
+import time
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+import pytz
+import cache
+import martialmatch_scraper
+import utils
+from cache import CacheEntry, SizedTTLCache, cache_entry_size
+from martialmatch_scraper import (BASE_URL, CACHE_MAX_STALENESS, DATE_FORMAT,
+                                  SCHEDULE_CACHE_TTL,
+                                  TIMEZONE, EventSchedule, Participant,
+                                  ParticipantIndex, ScheduleSlot,
+                                  _parse_schedule, _parse_starting_list,
+                                  _parse_tournament_page,
+                                  _to_local_time, close_tournament_catalog,
+                                  event_feeds, event_schedule_cache,
+                                  merge_participants_with_schedule,
+                                  participants_cache, refresh_tournament_catalog,
+                                  refresh_watched_events, schedule_cache,
+                                  stream_participants_schedule, watched_events)
+
+STARTING_LIST_JSON = {
+    "categories": [
+        {
+            "category": "adult; kobiety; -58 kg",
+            "competitors": [
+                {
+                    "firstName": "Anna",
+                    "lastName": "Testowa",
+                    "academy": "Academia Gorila",
+                    "branch": "Warszawa ",
+                },
+                {
+                    "firstName": "Ewa",
+                    "lastName": "Inna",
+                    "academy": "Other Club",
+                    "branch": "",
+                },
+            ],
+        },
+        {
+            "category": "adult; mężczyźni; -76 kg",
+            "competitors": [
+                {
+                    "firstName": "Jan",
+                    "lastName": "Kowalski",
+                    "academy": "Academia Gorila",
+                    "branch": "Ruda Śląska",
+                },
+                {
+                    "firstName": "Piotr",
+                    "lastName": "Nowak",
+                    "academy": "Academia Gorila",
+                    "branch": "Warszawa",
+                },
+                {"firstName": "Bez", "lastName": "Klubu", "academy": " "},
+            ],
+        },
+    ]
+}
+
+
+def test_participant_index_looks_up_club_by_stripped_branch():
+    index = ParticipantIndex(STARTING_LIST_JSON)
+    assert index.participants("Academia Gorila", "Warszawa") == [
+        ("Anna Testowa", "adult; kobiety; -58 kg"),
+        ("Piotr Nowak", "adult; mężczyźni; -76 kg"),
+    ]
+    assert index.participants("Unknown Club", "Warszawa") == []
+
+
+def test_participant_index_without_branch_returns_all_branches_in_order():
+    index = ParticipantIndex(STARTING_LIST_JSON)
+    assert [name for name, _ in index.participants("Academia Gorila")] == [
+        "Anna Testowa",
+        "Jan Kowalski",
+        "Piotr Nowak",
+    ]
+
+
+def test_participant_index_builds_sorted_club_list():
+    index = ParticipantIndex(STARTING_LIST_JSON)
+    assert [club["display_name"] for club in index.clubs] == [
+        "Academia Gorila (Ruda Śląska)",
+        "Academia Gorila (Warszawa)",
+        "Other Club",
+    ]
+
+
+def test_participant_index_searches_clubs_by_folded_word_prefixes():
+    index = ParticipantIndex(STARTING_LIST_JSON)
+    assert index.search_clubs("gorila slask", 10) == [
+        {
+            "academy": "Academia Gorila",
+            "branch": "Ruda Śląska",
+            "display_name": "Academia Gorila (Ruda Śląska)",
+            "competitors": 1,
+        }
+    ]
+    # Clubs with more competitors first
+    assert [club["display_name"] for club in index.search_clubs("", 2)] == [
+        "Academia Gorila (Warszawa)",
+        "Academia Gorila (Ruda Śląska)",
+    ]
+
+
+def test_participant_index_ranks_clubs_for_empty_query_by_size_then_name():
+    index = ParticipantIndex(_starting_list(70))
+    ranked = [club["display_name"] for club in index.search_clubs("", 50)]
+    # Clubs 0-9 have 3 competitors, the others 2
+    assert ranked == sorted(
+        (f"Club {i}" for i in range(30)), key=lambda name: (int(name[5:]) >= 10, name)
+    )
+    assert index.search_clubs("  ", 50) == index.search_clubs("", 50)
+
+
+def test_parse_starting_list_shares_club_strings_across_competitors():
+    index = _parse_starting_list(json.dumps(STARTING_LIST_JSON).encode())
+    anna, piotr = index.participants("Academia Gorila", "Warszawa")
+    assert (anna.name, piotr.name) == ("Anna Testowa", "Piotr Nowak")
+    academies = [academy for academy, _ in index.by_club if academy == "Academia Gorila"]
+    assert len(academies) == 2 and academies[0] is academies[1]
+    assert not hasattr(index, "json_data")
+
+
+SCHEDULE_JSON = {
+    "schedules": [
+        {
+            "name": "Dzień 2",
+            "mats": [
+                {
+                    "name": "Mata 1",
+                    "categories": [
+                        {
+                            "name": "adult; kobiety; -58 kg",
+                            "scheduledCategoryTime": {
+                                "start": "2024-01-02 09:00:00",
+                                "end": "2024-01-02 09:30:00",
+                            },
+                        }
+                    ],
+                }
+            ],
+        },
+        {
+            "name": "Dzień 1",
+            "mats": [
+                {
+                    "name": "Mata 2",
+                    "categories": [
+                        {
+                            "name": "adult; mężczyźni; -76 kg",
+                            "scheduledCategoryTime": {
+                                "start": "2024-01-01 10:00:00",
+                                "end": "2024-01-01 10:30:00",
+                            },
+                        },
+                        {
+                            "name": "adult; kobiety; -58 kg",
+                            "scheduledCategoryTime": {
+                                "start": "2024-01-01 10:00:00",
+                                "end": "2024-01-01 11:00:00",
+                            },
+                        },
+                    ],
+                }
+            ],
+        },
+    ]
+}
+
+
+def _schedule(json_data):
+    return _parse_schedule(json.dumps(json_data).encode())
+
+
+def test_parse_schedule_converts_times_to_warsaw():
+    assert _schedule(SCHEDULE_JSON)[0] == ScheduleSlot(
+        "adult; kobiety; -58 kg",
+        "Mata 1",
+        "Dzień 2",
+        "10:00 - 10:30",
+        1704186000,
+        1704187800,
+    )
+
+
+def test_merge_participants_with_schedule_sorts_and_groups_by_day():
+    participants = [
+        Participant("Piotr Nowak", "adult; mężczyźni; -76 kg"),
+        Participant("Anna Testowa", "adult; kobiety; -58 kg"),
+        Participant("Nie Ma", "adult; kobiety; -90 kg"),
+    ]
+    result = merge_participants_with_schedule(participants, _schedule(SCHEDULE_JSON))
+    assert list(result) == ["Dzień 1", "Dzień 2"]
+    assert [(r["name"], r["time"]) for r in result["Dzień 1"]] == [
+        ("Anna Testowa", "11:00 - 12:00"),
+        ("Piotr Nowak", "11:00 - 11:30"),
+    ]
+    assert result["Dzień 2"] == [
+        {
+            "name": "Anna Testowa",
+            "category": "adult; kobiety; -58 kg",
+            "mat": "Mata 1",
+            "day": "Dzień 2",
+            "time": "10:00 - 10:30",
+            "start_timestamp": 1704186000,
+            "end_timestamp": 1704187800,
+        }
+    ]
+
+
+def test_merge_participants_with_schedule_without_matches_is_empty():
+    participants = [Participant("Nie Ma", "adult; kobiety; -90 kg")]
+    assert merge_participants_with_schedule(participants, _schedule(SCHEDULE_JSON)) == {}
+
+
+def test_event_schedule_matches_per_request_merge():
+    index = ParticipantIndex(STARTING_LIST_JSON)
+    schedule = _schedule(SCHEDULE_JSON)
+    event_schedule = EventSchedule(index, schedule)
+    for academy, branch in [
+        ("Academia Gorila", "Warszawa"),
+        ("Academia Gorila", "Ruda Śląska"),
+        ("Academia Gorila", ""),
+        ("Other Club", ""),
+    ]:
+        expected = merge_participants_with_schedule(
+            index.participants(academy, branch), schedule
+        )
+        result = event_schedule.for_club(academy, branch)
+        assert list(result) == list(expected)
+        assert result == expected
+
+
+def test_event_schedule_for_unknown_club_is_empty():
+    event_schedule = EventSchedule(
+        ParticipantIndex(STARTING_LIST_JSON), _schedule(SCHEDULE_JSON)
+    )
+    assert event_schedule.for_club("Unknown Club", "Warszawa") == {}
+
+
+def _starting_list(competitors):
+    return {
+        "categories": [
+            {
+                "category": f"category {i % 20}",
+                "competitors": [
+                    {
+                        "firstName": "Anna",
+                        "lastName": f"Testowa {i}",
+                        "academy": f"Club {i % 30}",
+                        "branch": "",
+                    }
+                ],
+            }
+            for i in range(competitors)
+        ]
+    }
+
+
+def test_participants_cache_stays_within_byte_budget():
+    large = ParticipantIndex(_starting_list(3000))
+    small = ParticipantIndex(_starting_list(30))
+    large_size = cache_entry_size(large)
+    cache = SizedTTLCache(large_size + 20 * cache_entry_size(small), ttl=60)
+
+    # Big opens and small local events, in order of first request
+    for event in range(40):
+        cache[f"event {event}"] = CacheEntry(large if event % 8 == 0 else small)
+        assert cache.currsize <= cache.max_bytes
+
+    sizes = [cache_entry_size(entry) for entry in cache.values()]
+    assert sum(sizes) == cache.currsize
+    # The last big open and every event since the one before it, least recent first out
+    assert sizes.count(large_size) == 1
+    assert set(cache) == {f"event {event}" for event in range(25, 40)}
+
+    cache["oversized"] = CacheEntry(ParticipantIndex(_starting_list(9000)))
+    assert "oversized" not in cache
+
+
+def test_parse_results_are_measured_once_however_often_stored(monkeypatch):
+    index = ParticipantIndex(_starting_list(300))
+    schedule = _parse_schedule(json.dumps(SCHEDULE_JSON))
+    sizes = cache_entry_size(CacheEntry(index)), cache_entry_size(CacheEntry(schedule))
+    monkeypatch.setattr(cache, "deep_getsizeof", MagicMock(side_effect=AssertionError))
+    budgeted = SizedTTLCache(sum(sizes), ttl=60)
+    for _ in range(3):  # Unchanged refreshes store the same objects again
+        budgeted["index"] = CacheEntry(index)
+        budgeted["schedule"] = CacheEntry(schedule)
+    assert budgeted.currsize == sum(sizes)
+
+
+def test_cached_entries_expire_by_fetch_time_not_store_time():
+    # While upstream is down the last response is stored again with its
+    # original fetch time, which bounds how long it can be served
+    now = time.time()
+    participants_cache["outage"] = CacheEntry("index", now - CACHE_MAX_STALENESS - 1)
+    participants_cache["recent"] = CacheEntry("index", now - CACHE_MAX_STALENESS + 60)
+    assert "outage" not in participants_cache
+    assert "recent" in participants_cache
+    participants_cache.clear()
+
+
+def _reference_local_time(value):
+    local_time = (
+        datetime.strptime(value, DATE_FORMAT).replace(tzinfo=pytz.UTC).astimezone(TIMEZONE)
+    )
+    return int(local_time.timestamp()), local_time.strftime("%H:%M")
+
+
+@pytest.mark.parametrize(
+    "first_utc",
+    ["2024-03-30 22:00:00", "2024-10-26 22:00:00", "2023-12-31 20:00:00"],
+    ids=["dst_start", "dst_end", "new_year"],
+)
+def test_to_local_time_matches_pytz_across_boundaries(first_utc):
+    start = datetime.strptime(first_utc, DATE_FORMAT)
+    for minute in range(0, 6 * 60, 5):
+        value = (start + timedelta(minutes=minute, seconds=minute % 60)).strftime(
+            DATE_FORMAT
+        )
+        assert _to_local_time(value) == _reference_local_time(value), value
+
+
+def test_to_local_time_rejects_invalid_values():
+    for value in ["2024-13-01 10:00:00", "2024-01-01T10:00:00", "not a date"]:
+        with pytest.raises(ValueError):
+            _to_local_time(value)
+
+
+EVENTS_PAGE_HTML = """
+<script>var template = '<a href="/pl/events/9-in-script">x</a>';</script>
+<a href="/pl/events/1-puchar-polski"><img src="/1.jpg"></a>
+<h3><a href="/pl/events/1-puchar-polski/starting-lists">
+  <span>Puchar</span> Polski &amp; <!-- hidden --> Open </a></h3>
+<a href="/pl/events/2-grappling/">Grappling <a href="/pl/events">Wydarzenia</a> Cup</a>
+<a href="/pl/events/1-puchar-polski">Duplicate</a>
+<a href="/pl/events/archive?page=2">2</a><a href="/pl/events/archive?page=3">3</a>
+<div><a href="/pl/events/6">Six</div><a href="/pl/events/7">Seven</a></p>
+"""
+
+
+def test_parse_tournament_page_extracts_event_links_only():
+    page = _parse_tournament_page(EVENTS_PAGE_HTML.encode())
+    assert page.tournaments == [
+        {"id": "1-puchar-polski", "name": "Puchar Polski &  Open"},
+        {"id": "2-grappling", "name": "Grappling Wydarzenia Cup"},
+        {"id": "6", "name": "Six"},
+        {"id": "7", "name": "Seven"},
+    ]
+    assert page.last_pages == {"/pl/events/archive": 3}
+
+
+@pytest.fixture
+def events_pages():
+    """Serve events list pages from a dict of URL -> HTML, recording fetches."""
+    pages = {}
+    fetched = []
+
+    def mock_api(url, cookies=None, headers=None):
+        fetched.append(url)
+        response = MagicMock(status_code=200, headers={})
+        response.content = pages[url].encode()
+        return response
+
+    close_tournament_catalog()
+    utils._upstream_records.clear()
+    with patch("utils.make_api_request", side_effect=mock_api):
+        yield pages, fetched
+    close_tournament_catalog()
+    utils._upstream_records.clear()
+
+
+def _links(*ids):
+    return "".join(f'<a href="/pl/events/{i}">Event {i}</a>' for i in ids)
+
+
+def test_catalog_refresh_reads_archive_until_known_tournaments(events_pages):
+    pages, fetched = events_pages
+    archive = f"{BASE_URL}/pl/events/archive"
+    pages[f"{BASE_URL}/pl/events"] = _links(5)
+    pages[archive] = _links(4, 3) + '<a href="/pl/events/archive?page=2">2</a>'
+    pages[f"{archive}?page=2"] = _links(3, 2, 1)
+
+    catalog = asyncio.run(refresh_tournament_catalog())
+    assert [t["id"] for t in catalog.lists["archived"]] == ["4", "3", "2", "1"]
+    assert f"{archive}?page=2" in fetched
+
+    # Event 5 finished: it leaves the active list and tops the archive
+    pages[f"{BASE_URL}/pl/events"] = _links(6)
+    pages[archive] = _links(5, 4) + '<a href="/pl/events/archive?page=2">2</a>'
+    utils._upstream_records.clear()
+    fetched.clear()
+    catalog = asyncio.run(refresh_tournament_catalog())
+
+    assert [t["id"] for t in catalog.lists["active"]] == ["6"]
+    assert [t["id"] for t in catalog.lists["archived"]] == ["5", "4", "3", "2", "1"]
+    assert f"{archive}?page=2" not in fetched
+
+
+def _clear_event_caches():
+    for cache in (participants_cache, schedule_cache, event_schedule_cache):
+        cache.clear()
+    watched_events.clear()
+    event_feeds.clear()
+    utils._upstream_records.clear()
+
+
+@pytest.fixture
+def fake_upstream():
+    """Serve the starting list and a schedule the test can change, counting fetches."""
+    upstream = {"schedule": copy.deepcopy(SCHEDULE_JSON), "fetches": []}
+
+    def handler(request):
+        upstream["fetches"].append(request.url.path)
+        if "starting-lists" in request.url.path:
+            return httpx.Response(200, json=STARTING_LIST_JSON)
+        return httpx.Response(200, json=upstream["schedule"])
+
+    _clear_event_caches()
+    utils._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    yield upstream
+    asyncio.run(utils.close_http_client())
+    _clear_event_caches()
+
+
+def _move_day_one_to_mat_5(upstream):
+    upstream["schedule"]["schedules"][1]["mats"][0]["name"] = "Mata 5"
+    for entry in schedule_cache.values():
+        entry.fetched_at -= SCHEDULE_CACHE_TTL
+    for url, record in utils._upstream_records.items():
+        if url.endswith("/schedules"):
+            record.fetched_at -= SCHEDULE_CACHE_TTL
+
+
+def test_stream_sends_schedule_then_only_changed_rows(fake_upstream):
+    async def run():
+        stream = stream_participants_schedule("123", "Academia Gorila", "Warszawa")
+        first = await anext(stream)
+        _move_day_one_to_mat_5(fake_upstream)
+        await refresh_watched_events()
+        second = await anext(stream)
+        await stream.aclose()
+        return first, second
+
+    (first_event, snapshot), (second_event, diff) = asyncio.run(run())
+    assert first_event == "schedule"
+    assert snapshot["schedule"]["Dzień 1"][0]["mat"] == "Mata 2"
+    assert second_event == "diff"
+    assert diff["added"] == [] and diff["removed"] == []
+    assert {(row["key"], row["mat"]) for row in diff["changed"]} == {
+        ("Anna Testowa|adult; kobiety; -58 kg|0", "Mata 5"),
+        ("Piotr Nowak|adult; mężczyźni; -76 kg|0", "Mata 5"),
+    }
+    assert event_feeds == {}
+
+
+def test_stream_subscribers_share_one_upstream_poll(fake_upstream):
+    async def run():
+        streams = [
+            stream_participants_schedule("123", "Academia Gorila", "Warszawa")
+            for _ in range(1000)
+        ]
+        await asyncio.gather(*(anext(stream) for stream in streams))
+        fetches_before_refresh = len(fake_upstream["fetches"])
+        _move_day_one_to_mat_5(fake_upstream)
+        await refresh_watched_events()
+        diffs = await asyncio.gather(*(anext(stream) for stream in streams))
+        for stream in streams:
+            await stream.aclose()
+        return fetches_before_refresh, diffs
+
+    fetches_before_refresh, diffs = asyncio.run(run())
+    assert fetches_before_refresh == 2
+    assert len(fake_upstream["fetches"]) == 3
+    assert all(event == "diff" and len(diff["changed"]) == 2 for event, diff in diffs)
+
+
+def test_stream_sends_heartbeats_while_nothing_changes(fake_upstream, monkeypatch):
+    monkeypatch.setattr(martialmatch_scraper, "STREAM_HEARTBEAT_INTERVAL", 0.01)
+
+    async def run():
+        stream = stream_participants_schedule("123", "Academia Gorila", "Warszawa")
+        await anext(stream)
+        heartbeat = await anext(stream)
+        await stream.aclose()
+        return heartbeat
+
+    assert asyncio.run(run()) == (None, None)
+
+
+def test_refresh_scheduler_keeps_running_after_a_job_fails(monkeypatch):
+    passes = []
+
+    async def failing():
+        raise RuntimeError("upstream down")
+
+    async def last_job():
+        passes.append(len(passes))
+
+    monkeypatch.setattr(martialmatch_scraper, "REFRESH_INTERVAL", 0)
+    monkeypatch.setattr(martialmatch_scraper, "refresh_watched_events", failing)
+    monkeypatch.setattr(martialmatch_scraper, "refresh_stale_catalog", failing)
+    monkeypatch.setattr(martialmatch_scraper, "refresh_athlete_index", last_job)
+
+    async def run():
+        task = asyncio.create_task(martialmatch_scraper.run_refresh_scheduler())
+        while len(passes) < 2 and not task.done():
+            await asyncio.sleep(0)
+        task.cancel()
+        return task
+
+    task = asyncio.run(run())
+    assert passes == [0, 1]
+    assert task.cancelled()
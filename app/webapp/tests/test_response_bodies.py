@@ -0,0 +1,37 @@
+import gzip
+
+import brotli
+import orjson
+import pytest
+from response_bodies import EncodedBody, choose_encoding, format_sse_event
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate, br", "br"),
+        ("gzip, deflate", "gzip"),
+        ("br;q=0, gzip;q=0.5", "gzip"),
+        ("*", "br"),
+        ("identity", "identity"),
+        ("", "identity"),
+    ],
+)
+def test_choose_encoding(accept_encoding, expected):
+    assert choose_encoding(accept_encoding) == expected
+
+
+def test_encoded_body_variants_decode_to_the_same_json():
+    content = {"schedule": {"Dzień 1": [{"name": "Anna Testowa"}] * 50}}
+    body = EncodedBody(content)
+
+    assert orjson.loads(body.variant("identity")) == content
+    assert orjson.loads(gzip.decompress(body.variant("gzip"))) == content
+    assert orjson.loads(brotli.decompress(body.variant("br"))) == content
+    assert body.variant("br") is body.variant("br")
+
+
+def test_format_sse_event_puts_json_on_one_data_line():
+    assert format_sse_event("diff", {"removed": ["a|b|0"]}) == (
+        'event: diff\ndata: {"removed":["a|b|0"]}\n\n'
+    )
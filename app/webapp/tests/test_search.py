@@ -0,0 +1,14 @@
+from search import PrefixIndex, fold
+
+
+def test_fold_strips_polish_diacritics():
+    assert fold("Łódź Śląska ŻÓŁW") == "lodz slaska zolw"
+
+
+def test_prefix_index_matches_every_query_word():
+    index = PrefixIndex(enumerate(["Puchar Śląska", "Puchar Polski", "Łódź Open"]))
+    assert index.matches("puch") == {0, 1}
+    assert index.matches("puchar sla") == {0}
+    assert index.matches("lodz") == {2}
+    assert index.matches("open puchar") == set()
+    assert index.matches("  ") is None
@@ -0,0 +1,46 @@
+from martialmatch_scraper import ScheduleSlot
+from timeline import Timeline
+
+MINUTE = 60
+
+
+def _slot(category, mat, start, minutes):
+    start_timestamp = start * MINUTE
+    return ScheduleSlot(
+        category, mat, "Dzień 1", "", start_timestamp, start_timestamp + minutes * MINUTE
+    )
+
+
+# Mata 1: A and B back to back, C overlapping both; Mata 2: a long D, then E
+A = _slot("A", "Mata 1", 0, 20)
+B = _slot("B", "Mata 1", 20, 20)
+C = _slot("C", "Mata 1", 10, 40)
+D = _slot("D", "Mata 2", 0, 90)
+E = _slot("E", "Mata 2", 95, 10)
+TIMELINE = Timeline([E, B, D, A, C])
+
+
+def test_back_to_back_slots_switch_at_the_boundary():
+    assert TIMELINE.on_mat("Mata 1", 20 * MINUTE - 1, 5) == ([A, C], [B])
+    assert TIMELINE.on_mat("Mata 1", 20 * MINUTE, 5) == ([C, B], [])
+
+
+def test_long_slot_is_running_while_later_ones_start():
+    running, upcoming = TIMELINE.on_mat("Mata 2", 89 * MINUTE, 5)
+    assert running == [D]
+    assert upcoming == [E]
+    assert TIMELINE.on_mat("Mata 2", 92 * MINUTE, 5) == ([], [E])
+
+
+def test_categories_are_merged_by_start_time_and_limited():
+    running, upcoming = TIMELINE.in_categories({"A", "B", "C", "E"}, -1, 3)
+    assert running == []
+    assert upcoming == [A, C, B]
+    running, upcoming = TIMELINE.in_categories({"C", "D", "E"}, 30 * MINUTE, 5, "Mata 2")
+    assert running == [D]
+    assert upcoming == [E]
+
+
+def test_unknown_mat_or_category_is_empty():
+    assert TIMELINE.on_mat("Mata 9", 0, 5) == ([], [])
+    assert TIMELINE.in_categories({"Z"}, 0, 5) == ([], [])
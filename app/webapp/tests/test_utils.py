@@ -0,0 +1,415 @@
+import asyncio
+import json
+import time
+import weakref
+
+import httpx
+import pytest
+import utils
+from utils import (EventNotFoundHTTPError, RateLimiter,
+                   UpstreamUnavailableError, endpoint_label,
+                   extract_numeric_id, fetch_parsed, make_api_request)
+
+
+@pytest.fixture
+def mock_upstream(monkeypatch):
+    calls = []
+    monkeypatch.setattr(utils, "UPSTREAM_RETRY_BACKOFF", 0)
+    utils._circuit_breaker.record_success()
+
+    def install(handler):
+        def recording_handler(request):
+            calls.append(request)
+            return handler(request)
+
+        utils._http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(recording_handler)
+        )
+        return calls
+
+    yield install
+    asyncio.run(utils.close_http_client())
+    utils._upstream_records.clear()
+
+
+@pytest.fixture
+def shared_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "SHARED_CACHE_URL", f"sqlite:///{tmp_path / 'l2.db'}")
+    monkeypatch.setattr(utils, "SHARED_CACHE_POLL_INTERVAL", 0.01)
+    backend = asyncio.run(utils.open_shared_cache())
+    yield backend
+    asyncio.run(utils.close_shared_cache())
+
+
+def test_extract_numeric_id():
+    assert extract_numeric_id("123-test-tournament") == "123"
+    with pytest.raises(ValueError):
+        extract_numeric_id("no-digits")
+
+
+def test_endpoint_label_drops_ids_and_query():
+    assert (
+        endpoint_label("https://martialmatch.com/api/events/123/schedules")
+        == "/api/events/:id/schedules"
+    )
+    assert endpoint_label("https://martialmatch.com/pl/events?page=2") == "/pl/events"
+
+
+def test_make_api_request_reuses_shared_client(mock_upstream):
+    calls = mock_upstream(lambda request: httpx.Response(200, json={"ok": True}))
+
+    async def run():
+        first = await make_api_request("https://example.test/a", {"A": "1"})
+        second = await make_api_request("https://example.test/b")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.json() == {"ok": True}
+    assert second.status_code == 200
+    assert len(calls) == 2
+    assert calls[0].headers["Cookie"] == "A=1"
+
+
+def test_make_api_request_maps_404(mock_upstream):
+    mock_upstream(lambda request: httpx.Response(404))
+    with pytest.raises(EventNotFoundHTTPError):
+        asyncio.run(make_api_request("https://example.test/missing"))
+
+
+def test_make_api_request_wraps_upstream_errors(mock_upstream):
+    calls = mock_upstream(lambda request: httpx.Response(503))
+    with pytest.raises(Exception, match="Failed to fetch data"):
+        asyncio.run(make_api_request("https://example.test/down"))
+    assert len(calls) == utils.UPSTREAM_RETRIES_MAX + 1
+
+
+def test_make_api_request_retries_transient_failures(mock_upstream):
+    responses = iter([httpx.Response(502), httpx.Response(200, json={"ok": True})])
+    calls = mock_upstream(lambda request: next(responses))
+
+    response = asyncio.run(make_api_request("https://example.test/flaky"))
+
+    assert response.json() == {"ok": True}
+    assert len(calls) == 2
+
+
+def test_make_api_request_does_not_retry_client_errors(mock_upstream):
+    calls = mock_upstream(lambda request: httpx.Response(403))
+    with pytest.raises(Exception, match="Failed to fetch data"):
+        asyncio.run(make_api_request("https://example.test/forbidden"))
+    assert len(calls) == 1
+    assert utils._circuit_breaker.failures == 0
+
+
+def test_open_circuit_fails_fast_and_probes_after_reset_timeout(mock_upstream, monkeypatch):
+    calls = mock_upstream(lambda request: httpx.Response(503))
+    for _ in range(utils.BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(Exception, match="Failed to fetch data"):
+            asyncio.run(make_api_request("https://example.test/down"))
+    sent = len(calls)
+
+    with pytest.raises(UpstreamUnavailableError):
+        asyncio.run(make_api_request("https://example.test/down"))
+    assert len(calls) == sent
+
+    monkeypatch.setattr(utils._circuit_breaker, "reset_timeout", 0)
+    mock_upstream(lambda request: httpx.Response(200, json={"ok": True}))
+    assert asyncio.run(make_api_request("https://example.test/up")).status_code == 200
+    assert utils._circuit_breaker.state() == utils.CircuitBreaker.CLOSED
+
+
+def test_fetch_parsed_serves_last_response_while_circuit_is_open(mock_upstream):
+    calls = mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+    parse, _ = _counting_parser()
+    asyncio.run(fetch_parsed("https://example.test/lists", parse))
+    for _ in range(utils.BREAKER_FAILURE_THRESHOLD):
+        utils._circuit_breaker.record_failure()
+
+    result = asyncio.run(fetch_parsed("https://example.test/lists", parse))
+
+    assert result == {"version": 1}
+    assert len(calls) == 1
+    with pytest.raises(UpstreamUnavailableError):
+        asyncio.run(fetch_parsed("https://example.test/unknown", parse))
+
+
+def test_rate_limiter_caps_concurrency_and_rate():
+    limiter = RateLimiter(rate=100, burst=2, concurrency=2)
+    peak = []
+
+    async def request():
+        async with limiter.slot():
+            peak.append(limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        start = time.monotonic()
+        await asyncio.gather(*(request() for _ in range(6)))
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(run())
+    assert max(peak) == 2
+    # Two burst tokens, then four more at 100 per second
+    assert elapsed >= 0.035
+
+
+def _counting_parser():
+    parsed = []
+
+    def parse(content):
+        parsed.append(content)
+        return json.loads(content)
+
+    return parse, parsed
+
+
+def test_fetch_parsed_sends_validators_and_reuses_result_on_304(mock_upstream):
+    def handler(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(
+            200,
+            json={"version": 1},
+            headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 10:00:00 GMT"},
+        )
+
+    calls = mock_upstream(handler)
+    parse, parsed = _counting_parser()
+
+    async def run():
+        first = await fetch_parsed("https://example.test/schedules", parse)
+        second = await fetch_parsed("https://example.test/schedules", parse)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert len(parsed) == 1
+    assert "If-None-Match" not in calls[0].headers
+    assert calls[1].headers["If-None-Match"] == '"v1"'
+    assert calls[1].headers["If-Modified-Since"] == "Mon, 01 Jan 2024 10:00:00 GMT"
+
+
+def test_fetch_parsed_reuses_result_for_identical_body(mock_upstream):
+    mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+    parse, parsed = _counting_parser()
+
+    async def run():
+        first = await fetch_parsed("https://example.test/lists", parse)
+        second = await fetch_parsed("https://example.test/lists", parse)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert len(parsed) == 1
+
+
+class _ParseResult(list):
+    __slots__ = ("__weakref__",)
+
+
+def test_evicting_parse_result_from_function_cache_frees_it(mock_upstream):
+    mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+    function_cache = {}
+
+    async def run():
+        parsed = await fetch_parsed("https://example.test/lists", _ParseResult)
+        function_cache["lists"] = parsed
+        result = weakref.ref(parsed)
+        del parsed
+        assert await fetch_parsed("https://example.test/lists", _ParseResult) is result()
+        del function_cache["lists"]
+        return result
+
+    assert asyncio.run(run())() is None
+    assert utils._upstream_records.currsize < 1000
+
+
+def test_upstream_records_are_charged_for_results_they_own(mock_upstream):
+    mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+
+    asyncio.run(fetch_parsed("https://example.test/lists", lambda content: [0] * 100000))
+
+    assert utils._upstream_records.currsize > 800000
+
+
+def test_fetch_parsed_refetches_body_when_freed_result_cannot_be_rebuilt(mock_upstream):
+    calls = mock_upstream(
+        lambda request: httpx.Response(200, json={"version": 1}, headers={"ETag": '"v1"'})
+    )
+
+    async def run():
+        await fetch_parsed("https://example.test/lists", _ParseResult)
+        return await fetch_parsed("https://example.test/lists", _ParseResult)
+
+    assert json.loads(bytes(asyncio.run(run()))) == {"version": 1}
+    assert len(calls) == 2
+    assert "If-None-Match" not in calls[1].headers
+
+
+def test_fetch_parsed_parses_changed_body(mock_upstream):
+    versions = iter([1, 2])
+    mock_upstream(lambda request: httpx.Response(200, json={"version": next(versions)}))
+    parse, parsed = _counting_parser()
+
+    async def run():
+        first = await fetch_parsed("https://example.test/lists", parse)
+        second = await fetch_parsed("https://example.test/lists", parse)
+        return first, second
+
+    assert asyncio.run(run()) == ({"version": 1}, {"version": 2})
+    assert len(parsed) == 2
+
+
+def test_fetch_parsed_uses_record_another_replica_stored(mock_upstream, shared_cache):
+    calls = mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+    parse, parsed = _counting_parser()
+
+    first = asyncio.run(fetch_parsed("https://example.test/lists", parse, max_age=60))
+    utils._upstream_records.clear()  # a second replica starts with no local record
+    second = asyncio.run(fetch_parsed("https://example.test/lists", parse, max_age=60))
+
+    assert first == second == {"version": 1}
+    assert len(calls) == 1
+    assert len(parsed) == 2
+
+
+def test_fetch_parsed_ignores_shared_record_older_than_max_age(
+    mock_upstream, shared_cache
+):
+    calls = mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+    parse, _ = _counting_parser()
+
+    asyncio.run(fetch_parsed("https://example.test/lists", parse, max_age=60))
+    utils._upstream_records.clear()
+    asyncio.run(fetch_parsed("https://example.test/lists", parse, max_age=0.001))
+
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("value", [b"garbage", b"\x00\x00\x00\x02{}body"])
+def test_fetch_parsed_treats_undecodable_shared_record_as_miss(
+    mock_upstream, shared_cache, value
+):
+    calls = mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+    asyncio.run(shared_cache.set("upstream:https://example.test/lists", value, 60))
+
+    parsed = asyncio.run(fetch_parsed("https://example.test/lists", json.loads, max_age=60))
+
+    assert parsed == {"version": 1}
+    assert len(calls) == 1
+
+
+def test_fetch_parsed_coalesces_concurrent_fetches_through_shared_lock(
+    mock_upstream, shared_cache
+):
+    async def slow_handler(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"version": 1})
+
+    calls = mock_upstream(slow_handler)
+    parse, _ = _counting_parser()
+
+    async def run():
+        return await asyncio.gather(
+            *(
+                fetch_parsed("https://example.test/lists", parse, max_age=60)
+                for _ in range(5)
+            )
+        )
+
+    assert asyncio.run(run()) == [{"version": 1}] * 5
+    assert len(calls) == 1
+
+
+def test_fetch_parsed_stops_waiting_when_lock_is_released_without_record(
+    mock_upstream, shared_cache
+):
+    calls = mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+
+    async def run():
+        # Another replica holds the lock, then fails and releases it
+        token = await shared_cache.acquire_lock("lock:https://example.test/lists", 60)
+        waiter = asyncio.create_task(
+            fetch_parsed("https://example.test/lists", json.loads, max_age=60)
+        )
+        await asyncio.sleep(0.05)
+        await shared_cache.release_lock("lock:https://example.test/lists", token)
+        start = time.monotonic()
+        result = await waiter
+        return result, time.monotonic() - start
+
+    result, waited = asyncio.run(run())
+    assert result == {"version": 1}
+    assert len(calls) == 1
+    assert waited < 1
+
+
+def test_fetch_parsed_extends_lock_while_fetching(mock_upstream, shared_cache, monkeypatch):
+    monkeypatch.setattr(utils, "SHARED_CACHE_LOCK_TTL", 0.1)
+
+    async def slow_handler(request):
+        await asyncio.sleep(0.3)
+        return httpx.Response(200, json={"version": 1})
+
+    mock_upstream(slow_handler)
+
+    async def run():
+        fetch = asyncio.create_task(
+            fetch_parsed("https://example.test/lists", json.loads, max_age=60)
+        )
+        await asyncio.sleep(0.2)
+        held = await shared_cache.get("lock:https://example.test/lists")
+        await fetch
+        return held, await shared_cache.get("lock:https://example.test/lists")
+
+    held, after = asyncio.run(run())
+    assert held is not None
+    assert after is None
+
+
+def test_fetch_parsed_survives_shared_cache_failure(mock_upstream, shared_cache):
+    calls = mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+    parse, _ = _counting_parser()
+    asyncio.run(shared_cache.close())
+
+    result = asyncio.run(fetch_parsed("https://example.test/lists", parse, max_age=60))
+
+    assert result == {"version": 1}
+    assert len(calls) == 1
+
+
+def test_snapshot_restores_records_without_upstream_calls(
+    mock_upstream, tmp_path, monkeypatch
+):
+    snapshot_path = str(tmp_path / "snapshot.bin")
+    monkeypatch.setattr(utils, "CACHE_SNAPSHOT_PATH", snapshot_path)
+    calls = mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+    parse, _ = _counting_parser()
+
+    asyncio.run(fetch_parsed("https://example.test/lists", parse, max_age=60))
+    asyncio.run(utils.save_snapshot())
+    utils._upstream_records.clear()
+
+    assert utils.load_snapshot() == 1
+    result = asyncio.run(fetch_parsed("https://example.test/lists", parse, max_age=60))
+    assert result == {"version": 1}
+    assert len(calls) == 1
+
+
+def test_snapshot_skips_expired_records(mock_upstream, tmp_path, monkeypatch):
+    snapshot_path = str(tmp_path / "snapshot.bin")
+    monkeypatch.setattr(utils, "CACHE_SNAPSHOT_PATH", snapshot_path)
+    mock_upstream(lambda request: httpx.Response(200, json={"version": 1}))
+    parse, _ = _counting_parser()
+
+    asyncio.run(fetch_parsed("https://example.test/lists", parse, max_age=60))
+    for record in utils._upstream_records.values():
+        record.fetched_at -= utils.UPSTREAM_RECORD_TTL
+    asyncio.run(utils.save_snapshot())
+    utils._upstream_records.clear()
+
+    assert utils.load_snapshot() == 0
+
+
+def test_load_snapshot_ignores_missing_file(tmp_path):
+    assert utils.load_snapshot(str(tmp_path / "missing.bin")) == 0
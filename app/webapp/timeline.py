@@ -0,0 +1,89 @@
+import sys
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from itertools import islice
+
+
+class IntervalList:
+    """Schedule slots sorted by start time, searched with binary search.
+
+    Slots may overlap; one running at a time ``t`` started no earlier than
+    ``t`` minus the longest slot, so only that window is scanned.
+    """
+
+    __slots__ = ("slots", "starts", "max_duration")
+
+    def __init__(self, slots):
+        self.slots = sorted(slots, key=lambda slot: slot.start_timestamp)
+        self.starts = [slot.start_timestamp for slot in self.slots]
+        self.max_duration = max(
+            (slot.end_timestamp - slot.start_timestamp for slot in self.slots), default=0
+        )
+
+    def running(self, at):
+        """Slots with start <= at < end, by start time."""
+        first = bisect_left(self.starts, at - self.max_duration)
+        last = bisect_right(self.starts, at)
+        return [slot for slot in self.slots[first:last] if slot.end_timestamp > at]
+
+    def upcoming(self, at):
+        """Iterate over slots starting after ``at``, by start time."""
+        return islice(self.slots, bisect_right(self.starts, at), None)
+
+
+def _interval_lists(slots, key):
+    groups = {}
+    for slot in slots:
+        groups.setdefault(key(slot), []).append(slot)
+    return {name: IntervalList(group) for name, group in groups.items()}
+
+
+class Timeline:
+    """Slots of an event's schedule indexed by mat and by category.
+
+    Built once per schedule version; answering what runs now and next on a
+    mat or in a club's categories is a few binary searches.
+    """
+
+    __slots__ = ("schedule", "by_mat", "by_category")
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.by_mat = _interval_lists(schedule, lambda slot: slot.mat)
+        self.by_category = _interval_lists(schedule, lambda slot: slot.category)
+
+    def cache_size(self):
+        # The slots themselves belong to the schedule held by its own cache
+        lists = [*self.by_mat.values(), *self.by_category.values()]
+        return (
+            sys.getsizeof(self.by_mat)
+            + sys.getsizeof(self.by_category)
+            + sum(sys.getsizeof(item.slots) + sys.getsizeof(item.starts) for item in lists)
+        )
+
+    def is_built_from(self, schedule):
+        return self.schedule is schedule
+
+    def on_mat(self, mat, at, limit):
+        """Return (running, upcoming) slots of a mat, at most ``limit`` upcoming."""
+        intervals = self.by_mat.get(mat)
+        if intervals is None:
+            return [], []
+        return intervals.running(at), list(islice(intervals.upcoming(at), limit))
+
+    def in_categories(self, categories, at, limit, mat=""):
+        """Return (running, upcoming) slots of the given categories, by start
+        time, optionally on one mat only."""
+        lists = [self.by_category[name] for name in categories if name in self.by_category]
+        running = sorted(
+            (slot for intervals in lists for slot in intervals.running(at)),
+            key=lambda slot: slot.start_timestamp,
+        )
+        upcoming = merge(
+            *(intervals.upcoming(at) for intervals in lists),
+            key=lambda slot: slot.start_timestamp,
+        )
+        if mat:
+            running = [slot for slot in running if slot.mat == mat]
+            upcoming = (slot for slot in upcoming if slot.mat == mat)
+        return running, list(islice(upcoming, limit))
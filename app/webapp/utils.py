@@ -1,14 +1,260 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
 import re
+import sys
+import time
+import weakref
+import zlib
+from contextlib import asynccontextmanager
 
-import requests
+import httpx
+from cache import (SizedTLRUCache, cache_entry_size, create_shared_cache,
+                   report_fetched_at, report_version)
+from metrics import (PARSE_TIME, UPSTREAM_CIRCUIT_STATE, UPSTREAM_FALLBACKS,
+                     UPSTREAM_IN_FLIGHT, UPSTREAM_LATENCY,
+                     UPSTREAM_RATE_TOKENS, UPSTREAM_REJECTED,
+                     UPSTREAM_REQUESTS, UPSTREAM_RETRIES, instrument_cache)
 
+logger = logging.getLogger(__name__)
 
-class EventNotFoundHTTPError(requests.HTTPError):
+UPSTREAM_TIMEOUT = httpx.Timeout(10.0, connect=5.0)  # Per-request timeouts in seconds
+UPSTREAM_LIMITS = httpx.Limits(
+    max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0
+)
+UPSTREAM_RATE = float(os.environ.get("UPSTREAM_RATE", "10"))  # Requests per second
+UPSTREAM_BURST = 20  # Requests allowed at once after an idle period
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", "8"))  # In flight
+UPSTREAM_RETRIES_MAX = 2  # Retries of a request failing with a 5xx or a timeout
+UPSTREAM_RETRY_BACKOFF = 0.5  # Base of the jittered exponential backoff in seconds
+BREAKER_FAILURE_THRESHOLD = 5  # Consecutive failed requests that open the circuit
+BREAKER_RESET_TIMEOUT = 30  # Seconds the circuit stays open before a probe request
+NUMBER_PATTERN = re.compile(r"\d+")
+UPSTREAM_RECORD_TTL = 10800  # Keep validators as long as stale cache entries live
+CACHE_MEMORY_BUDGET = int(os.environ.get("CACHE_MEMORY_BUDGET", 96 * 2**20))  # Bytes
+UPSTREAM_RECORD_BYTES = int(  # Compressed bodies of upstream responses
+    os.environ.get("UPSTREAM_RECORD_BYTES", CACHE_MEMORY_BUDGET * 30 // 100)
+)
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL", "")  # redis:// or sqlite:///
+SHARED_CACHE_LOCK_TTL = 15  # Seconds a fetch lock outlives its last extension
+SHARED_CACHE_POLL_INTERVAL = 0.1  # Seconds between checks while another replica fetches
+CACHE_SNAPSHOT_PATH = os.environ.get("CACHE_SNAPSHOT_PATH", "")  # Warm-start file
+CACHE_SNAPSHOT_INTERVAL = 300  # Seconds between periodic cache snapshots
+
+_http_client = None
+_shared_cache = None
+_upstream_records = SizedTLRUCache(
+    UPSTREAM_RECORD_BYTES,
+    ttu=lambda url, record, now: record.fetched_at + UPSTREAM_RECORD_TTL,
+    timer=time.time,
+)
+instrument_cache("upstream_records", _upstream_records)
+
+
+class EventNotFoundHTTPError(Exception):
     """Specific HTTP error for 404 event not found cases."""
 
     pass
 
 
+class UpstreamError(Exception):
+    """Upstream failed to answer or answered with an error status."""
+
+    pass
+
+
+class UpstreamUnavailableError(UpstreamError):
+    """Request not sent because the circuit breaker considers upstream down."""
+
+    pass
+
+
+class RateLimiter:
+    """Token bucket of ``rate`` requests per second with bursts of ``burst``,
+    letting at most ``concurrency`` requests be in flight at once."""
+
+    def __init__(self, rate, burst, concurrency):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._semaphores = {}
+
+    def tokens(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self._tokens
+
+    async def _take_token(self):
+        while self.tokens() < 1:
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+        self._tokens -= 1
+
+    def _semaphore(self):
+        # asyncio primitives belong to one loop; tests run several in turn
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            self._semaphores = {loop: asyncio.Semaphore(self.concurrency)}
+            semaphore = self._semaphores[loop]
+        return semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a free slot and a token, then hold the slot."""
+        async with self._semaphore():
+            await self._take_token()
+            self.in_flight += 1
+            UPSTREAM_IN_FLIGHT.inc()
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+                UPSTREAM_IN_FLIGHT.dec()
+
+
+class CircuitBreaker:
+    """Fails requests fast after ``failure_threshold`` consecutive failures.
+
+    Once ``reset_timeout`` seconds have passed, one probe request is let
+    through (half-open); its success closes the circuit, its failure opens
+    it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._probe_started = None
+
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self):
+        state = self.state()
+        if state == self.HALF_OPEN:
+            now = time.monotonic()
+            # A probe that never reported back does not block the circuit forever
+            if self._probe_started is None or now - self._probe_started >= self.reset_timeout:
+                self._probe_started = now
+                return True
+            return False
+        return state == self.CLOSED
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_started = None
+        if self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+
+
+_rate_limiter = RateLimiter(UPSTREAM_RATE, UPSTREAM_BURST, UPSTREAM_CONCURRENCY)
+_circuit_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+UPSTREAM_CIRCUIT_STATE.set_function(_circuit_breaker.state)
+UPSTREAM_RATE_TOKENS.set_function(_rate_limiter.tokens)
+
+
+class UpstreamRecord:
+    """Validators and parsed result of the last response received for a URL.
+
+    ``body`` holds the zlib-compressed response body when it has to be shared
+    with other replicas; records read from the shared cache have no ``parsed``.
+
+    A parse result supporting weak references is referenced weakly: the cache
+    of the function that parsed it owns it, so evicting it there frees it.
+    Other results are owned by the record and charged to its size.
+    """
+
+    __slots__ = ("etag", "last_modified", "digest", "fetched_at", "body", "_parsed")
+
+    def __init__(self, digest, parsed, body=None, fetched_at=None):
+        self.etag = None
+        self.last_modified = None
+        self.digest = digest
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.body = body
+        self.parsed = parsed
+
+    @property
+    def parsed(self):
+        parsed = self._parsed
+        return parsed() if type(parsed) is weakref.ref else parsed
+
+    @parsed.setter
+    def parsed(self, parsed):
+        try:
+            self._parsed = weakref.ref(parsed)
+        except TypeError:
+            self._parsed = parsed
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def has_result(self):
+        """Whether the parse result is alive or can be made again from the body."""
+        return self.body is not None or self.parsed is not None
+
+    def ensure_parsed(self, parse):
+        """Parse the stored body if the record was restored without a result
+        or its result was freed."""
+        parsed = self.parsed
+        if parsed is None:
+            parsed = self.parsed = parse(zlib.decompress(self.body))
+        return parsed
+
+    def to_bytes(self):
+        header = json.dumps(
+            {
+                "etag": self.etag,
+                "last_modified": self.last_modified,
+                "digest": self.digest,
+                "fetched_at": self.fetched_at,
+            }
+        ).encode()
+        return len(header).to_bytes(4, "big") + header + self.body
+
+    @classmethod
+    def from_bytes(cls, data):
+        header_length = int.from_bytes(data[:4], "big")
+        header = json.loads(data[4 : 4 + header_length])
+        record = cls(header["digest"], None, data[4 + header_length :], header["fetched_at"])
+        record.etag = header["etag"]
+        record.last_modified = header["last_modified"]
+        return record
+
+    def cache_size(self):
+        size = sys.getsizeof(self) + (len(self.body) if self.body is not None else 0)
+        if type(self._parsed) is not weakref.ref and self._parsed is not None:
+            size += cache_entry_size(self._parsed)
+        return size
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
 def extract_numeric_id(event_id):
     """Extract numeric ID from event identifier."""
     match = re.search(r"\d+", str(event_id))
@@ -17,22 +263,316 @@ def extract_numeric_id(event_id):
     return match.group(0)
 
 
-def make_api_request(url, cookies=None):
-    """Make an API request."""
-    try:
-        response = requests.get(
-            url,
-            headers={
-                "Cookie": "; ".join(f"{k}={v}" for k, v in (cookies or {}).items()),
-                "Accept-encoding": "gzip, deflate",
-            },
+async def open_http_client():
+    """Open the shared keep-alive connection pool used for upstream requests."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUT,
+            limits=UPSTREAM_LIMITS,
+            headers={"Accept-encoding": "gzip, deflate"},
         )
-        if response.status_code == 404:
-            raise EventNotFoundHTTPError()
-        response.raise_for_status()
-        return response
-    except EventNotFoundHTTPError:
-        raise  # Re-raise our custom 404 exception as-is
-    except requests.RequestException as e:
-        raise Exception(f"Failed to fetch data from {url}: {str(e)}")
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared connection pool."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def endpoint_label(url):
+    """Name an upstream endpoint by its URL path with the numbers taken out."""
+    return NUMBER_PATTERN.sub(":id", httpx.URL(url).path)
+
+
+def _is_transient(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+async def make_api_request(url, cookies=None, headers=None):
+    """Make an API request.
+
+    Requests go through the shared rate limiter, 5xx responses and timeouts
+    are retried with jittered backoff, and while the circuit breaker is open
+    UpstreamUnavailableError is raised without calling upstream.
+    """
+    if not _circuit_breaker.allow():
+        UPSTREAM_REJECTED.inc()
+        raise UpstreamUnavailableError(f"Upstream unavailable, not fetching {url}")
+    client = await open_http_client()
+    latency = UPSTREAM_LATENCY.labels(endpoint_label(url))
+    for attempt in range(UPSTREAM_RETRIES_MAX + 1):
+        try:
+            async with _rate_limiter.slot():
+                start = time.perf_counter()
+                response = await client.get(
+                    url,
+                    headers={
+                        "Cookie": "; ".join(f"{k}={v}" for k, v in (cookies or {}).items()),
+                        **(headers or {}),
+                    },
+                )
+                latency.observe(time.perf_counter() - start)
+            if response.status_code == 404:
+                UPSTREAM_REQUESTS.labels("not_found").inc()
+                _circuit_breaker.record_success()
+                raise EventNotFoundHTTPError()
+            if response.status_code != 304:
+                response.raise_for_status()
+            UPSTREAM_REQUESTS.labels("ok").inc()
+            _circuit_breaker.record_success()
+            return response
+        except httpx.HTTPError as e:
+            if _is_transient(e) and attempt < UPSTREAM_RETRIES_MAX:
+                UPSTREAM_RETRIES.inc()
+                await asyncio.sleep(random.uniform(0, UPSTREAM_RETRY_BACKOFF * 2**attempt))
+                continue
+            UPSTREAM_REQUESTS.labels("failed").inc()
+            if _is_transient(e):
+                _circuit_breaker.record_failure()
+            else:
+                _circuit_breaker.record_success()
+            raise UpstreamError(f"Failed to fetch data from {url}: {str(e)}")
+
+
+async def open_shared_cache():
+    """Connect to the shared cache configured by SHARED_CACHE_URL, if any."""
+    global _shared_cache
+    if _shared_cache is None and SHARED_CACHE_URL:
+        _shared_cache = create_shared_cache(SHARED_CACHE_URL)
+    return _shared_cache
+
+
+async def close_shared_cache():
+    global _shared_cache
+    if _shared_cache is not None:
+        await _shared_cache.close()
+        _shared_cache = None
+
+
+async def _shared_cache_call(method, *args):
+    """Call the shared cache, treating its failures like a cache miss."""
+    try:
+        return await getattr(_shared_cache, method)(*args)
+    except Exception as e:
+        logger.warning(f"Shared cache {method} failed: {e}")
+        return None
+
+
+async def _read_shared_record(url, max_age):
+    data = await _shared_cache_call("get", f"upstream:{url}")
+    if data is None:
+        return None
+    try:
+        record = UpstreamRecord.from_bytes(data)
+    except (ValueError, KeyError, TypeError) as e:
+        # E.g. truncated, or written by a replica with another record format
+        logger.warning(f"Ignoring undecodable shared cache record of {url}: {e}")
+        return None
+    return record if time.time() - record.fetched_at < max_age else None
+
+
+async def _wait_for_shared_record(url, max_age):
+    """Poll the shared cache while another replica fetches the URL.
+
+    Returns None once its lock is gone without a record stored, e.g. because
+    the fetch failed or the replica died.
+    """
+    while True:
+        await asyncio.sleep(SHARED_CACHE_POLL_INTERVAL)
+        # The lock is released after the record is stored, so check it first
+        locked = await _shared_cache_call("get", f"lock:{url}") is not None
+        record = await _read_shared_record(url, max_age)
+        if record is not None or not locked:
+            return record
+
+
+async def _keep_lock(url, token):
+    """Extend a held fetch lock until cancelled, however long retries take."""
+    while True:
+        await asyncio.sleep(SHARED_CACHE_LOCK_TTL / 3)
+        await _shared_cache_call("extend_lock", f"lock:{url}", token, SHARED_CACHE_LOCK_TTL)
+
+
+def _report_record(record):
+    """Stamp the cache entry being loaded with the record's fetch time and body."""
+    report_fetched_at(record.fetched_at)
+    report_version(record.digest)
+
+
+def _adopt_shared_record(url, record, shared_record, parse):
+    """Take over a record fetched by another replica, parsing it if it changed.
+
+    Returns the record and its parse result.
+    """
+    if record is not None and record.digest == shared_record.digest:
+        shared_record.parsed = record.parsed
+    parsed = shared_record.ensure_parsed(parse)
+    _upstream_records[url] = shared_record
+    return shared_record, parsed
+
+
+def _stored_result(url, record, parse):
+    """Return the parse result of a stored record, parsing its body again if
+    needed; the record is then stored again to be charged for a result it owns."""
+    parsed = record.parsed
+    if parsed is None:
+        parsed = record.ensure_parsed(parse)
+        _upstream_records[url] = record
+    return parsed
+
+
+async def fetch_parsed(url, parse, cookies=None, max_age=None):
+    """Fetch a URL and return ``parse(content)`` of its body.
+
+    Validators of the previous response are sent along, and when upstream
+    answers 304 or returns a body identical to the previous one, the previous
+    parse result is reused instead of parsing again.
+
+    A body fetched less than ``max_age`` seconds ago, e.g. one restored from a
+    snapshot, is used without calling upstream. With a shared cache configured
+    the same goes for bodies other replicas fetched, and a lock in the shared
+    cache lets only one replica at a time fetch the URL.
+    """
+    record = _upstream_records.get(url)
+    if record is not None and max_age and record.age() < max_age and record.has_result():
+        _report_record(record)
+        return _stored_result(url, record, parse)
+    lock_token = None
+    if _shared_cache is not None and max_age:
+        shared_record = await _read_shared_record(url, max_age)
+        if shared_record is None:
+            try:
+                lock_token = await _shared_cache.acquire_lock(
+                    f"lock:{url}", SHARED_CACHE_LOCK_TTL
+                )
+                if lock_token is None:
+                    shared_record = await _wait_for_shared_record(url, max_age)
+            except Exception as e:
+                logger.warning(f"Shared cache acquire_lock failed: {e}")
+        if shared_record is not None:
+            record, parsed = _adopt_shared_record(url, record, shared_record, parse)
+            _report_record(record)
+            return parsed
+    lock_keeper = asyncio.create_task(_keep_lock(url, lock_token)) if lock_token else None
+    try:
+        try:
+            record, parsed = await _fetch_record(url, record, parse, cookies)
+        except UpstreamUnavailableError:
+            if record is None or not record.has_result():
+                raise
+            UPSTREAM_FALLBACKS.inc()
+            logger.warning(f"Upstream unavailable, serving the last response of {url}")
+            _report_record(record)
+            return _stored_result(url, record, parse)
+        if _shared_cache is not None and record.body is not None:
+            await _shared_cache_call(
+                "set", f"upstream:{url}", record.to_bytes(), UPSTREAM_RECORD_TTL
+            )
+    finally:
+        if lock_token is not None:
+            lock_keeper.cancel()
+            await _shared_cache_call("release_lock", f"lock:{url}", lock_token)
+    _report_record(record)
+    return parsed
+
+
+async def _fetch_record(url, record, parse, cookies):
+    """Fetch a URL upstream, reusing ``record`` when the body did not change.
+
+    Returns the record stored for the URL and its parse result.
+    """
+    parsed = record.parsed if record is not None else None  # Kept alive while fetching
+    if parsed is None and record is not None and record.body is None:
+        record = None  # Its result was freed, a 304 would leave nothing to serve
+    headers = record.conditional_headers() if record is not None else None
+    response = await make_api_request(url, cookies, headers)
+    if record is None or response.status_code != 304:
+        digest = hashlib.blake2b(response.content, digest_size=16).hexdigest()
+        if record is None or record.digest != digest:
+            record = UpstreamRecord(digest, None)
+            parsed = None
+        if parsed is None:
+            with PARSE_TIME.labels(endpoint_label(url)).time():
+                parsed = record.parsed = parse(response.content)
+        if _keeps_bodies() and record.body is None:
+            record.body = zlib.compress(response.content, 1)
+        record.etag = response.headers.get("ETag")
+        record.last_modified = response.headers.get("Last-Modified")
+    if parsed is None:
+        parsed = record.ensure_parsed(parse)
+    record.fetched_at = time.time()
+    _upstream_records[url] = record
+    return record, parsed
+
+
+def _keeps_bodies():
+    """Whether response bodies are kept for the shared cache or snapshots."""
+    return _shared_cache is not None or bool(CACHE_SNAPSHOT_PATH)
+
+
+def load_snapshot(path=None):
+    """Restore upstream records saved by save_snapshot, skipping expired ones.
+
+    Returns the number of records restored.
+    """
+    path = path or CACHE_SNAPSHOT_PATH
+    if not path or not os.path.exists(path):
+        return 0
+    restored = 0
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset < len(data):
+            url_length = int.from_bytes(data[offset : offset + 4], "big")
+            url = data[offset + 4 : offset + 4 + url_length].decode()
+            offset += 4 + url_length
+            record_length = int.from_bytes(data[offset : offset + 4], "big")
+            record = UpstreamRecord.from_bytes(data[offset + 4 : offset + 4 + record_length])
+            offset += 4 + record_length
+            if record.age() < UPSTREAM_RECORD_TTL:
+                _upstream_records[url] = record
+                restored += 1
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Failed to load cache snapshot from {path}: {e}")
+    return restored
+
+
+def _write_snapshot(path, records):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        for url, record in records:
+            url_bytes = url.encode()
+            record_bytes = record.to_bytes()
+            f.write(len(url_bytes).to_bytes(4, "big") + url_bytes)
+            f.write(len(record_bytes).to_bytes(4, "big") + record_bytes)
+    os.replace(temp_path, path)
+
+
+async def save_snapshot(path=None):
+    """Write the upstream records with their bodies and fetch times to disk."""
+    path = path or CACHE_SNAPSHOT_PATH
+    if not path:
+        return
+    records = [
+        (url, record)
+        for url, record in list(_upstream_records.items())
+        if record.body is not None
+    ]
+    try:
+        await asyncio.to_thread(_write_snapshot, path, records)
+    except OSError as e:
+        logger.warning(f"Failed to save cache snapshot to {path}: {e}")
+
 
+async def run_snapshot_writer():
+    """Periodically save a cache snapshot, started from the app lifespan."""
+    while True:
+        await asyncio.sleep(CACHE_SNAPSHOT_INTERVAL)
+        await save_snapshot()